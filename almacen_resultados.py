@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+FORMATO = b'OLAPR1'    # Cabecera y versión del formato de archivo
+
+ResultadoGuardado = namedtuple('ResultadoGuardado', ['filas', 'version', 'guardado_en'])
+
+def _a_columnas(filas):
+    """Lista de diccionarios -> (nombres de columna, lista de valores por columna)."""
+    if not filas:
+        return [], []
+    columnas = list(filas[0])
+    return columnas, [[fila[c] for fila in filas] for c in columnas]
+
+def _a_filas(columnas, valores):
+    return [dict(zip(columnas, fila)) for fila in zip(*valores)] if columnas else []
+
+class AlmacenResultados:
+    """
+    Guarda resultados de consultas (listas de diccionarios) en disco, uno
+    por archivo, en formato columnar comprimido con zlib. Cada resultado
+    lleva la versión de los datos con que se obtuvo.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        nombre = hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+        return os.path.join(self.directorio, nombre + '.bin')
+
+    def leer(self, clave):
+        """Devuelve el ResultadoGuardado de clave, o None si no hay uno válido."""
+        try:
+            with open(self._ruta(clave), 'rb') as f:
+                datos = f.read()
+        except OSError:
+            return None
+        if not datos.startswith(FORMATO):
+            return None
+        try:
+            contenido = json.loads(zlib.decompress(datos[len(FORMATO):]).decode('utf-8'))
+        except (zlib.error, ValueError):
+            return None
+        if contenido['clave'] != repr(clave):
+            return None
+        return ResultadoGuardado(_a_filas(contenido['columnas'], contenido['valores']),
+                                 contenido['version'], contenido['guardado_en'])
+
+    def guardar(self, clave, version, filas):
+        """Escribe el resultado de forma atómica (archivo temporal + os.replace)."""
+        columnas, valores = _a_columnas(filas)
+        contenido = {'clave': repr(clave), 'version': version, 'guardado_en': time.time(),
+                     'columnas': columnas, 'valores': valores}
+        datos = FORMATO + zlib.compress(json.dumps(contenido, ensure_ascii=False).encode('utf-8'))
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def limpiar(self):
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.bin'):
+                os.remove(os.path.join(self.directorio, nombre))
@@ -1,424 +1,1542 @@
+from cassandra import InvalidRequest
 from cassandra.cluster import Cluster
 from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.policies import HostDistance
+import asyncio
+import contextvars
+import hashlib
+import os
+import re
+import sys
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 import time
 
-# Establecer conexión con configuración optimizada
-cluster = Cluster(
-    ['127.0.0.1'],
-    # Optimizaciones de conexión
-    load_balancing_policy=None,
-    default_retry_policy=None,
-    compression=True,
-    protocol_version=4
-)
-session = cluster.connect('spotify_test')
-
-# Configurar timeouts y fetch size para mejor rendimiento
-session.default_timeout = 30
-session.default_fetch_size = 1000  # Traer más registros por batch
+from almacen_resultados import AlmacenResultados
+from metricas_olap import anotar_cache, anotar_error, anotar_pagina, fase, instrumentada, metricas
+
+# El registro de cubos se comparte con el cargador, en datos/
+from datos.cubos_olap import CUBOS, CUBOS_DISTINTOS, CUBOS_POR_NOMBRE
+from datos.hyperloglog import HyperLogLog
+
+# Configuración de conexión por defecto; las variables de entorno
+# SPOTIFY_CASSANDRA_* y configurar() la reemplazan
+CONFIGURACION = {
+    'hosts': ['127.0.0.1'],
+    'puerto': 9042,
+    'keyspace': 'spotify_test',
+    'protocol_version': 4,
+    'compresion': True,
+    'timeout': 30,
+    'fetch_size': 1000,          # Traer más registros por página
+    'hilos_executor': 2,         # Hilos del driver para callbacks y tareas internas
+    'conexiones_por_host': None, # (mínimo, máximo); solo aplica con protocol_version 1 o 2
+}
+
+# Variable de entorno -> (clave, conversión)
+VARIABLES_ENTORNO = {
+    'SPOTIFY_CASSANDRA_HOSTS': ('hosts', lambda v: [h.strip() for h in v.split(',') if h.strip()]),
+    'SPOTIFY_CASSANDRA_PUERTO': ('puerto', int),
+    'SPOTIFY_CASSANDRA_KEYSPACE': ('keyspace', str),
+    'SPOTIFY_CASSANDRA_PROTOCOLO': ('protocol_version', int),
+    'SPOTIFY_CASSANDRA_TIMEOUT': ('timeout', float),
+    'SPOTIFY_CASSANDRA_HILOS': ('hilos_executor', int),
+    'SPOTIFY_CASSANDRA_CONEXIONES': ('conexiones_por_host', lambda v: tuple(int(x) for x in v.split(','))),
+}
+
+def configuracion_del_entorno():
+    """CONFIGURACION con los valores de las variables de entorno definidas."""
+    configuracion = dict(CONFIGURACION)
+    for variable, (clave, convertir) in VARIABLES_ENTORNO.items():
+        if os.environ.get(variable):
+            configuracion[clave] = convertir(os.environ[variable])
+    return configuracion
+
+class ClienteOLAP:
+    """
+    Conexión perezosa a Cassandra: el Cluster y la sesión se crean en el
+    primer uso de session, con la configuración dada (o la del entorno).
+    Importar el módulo no abre ninguna conexión.
+    """
+
+    def __init__(self, **configuracion):
+        self.configuracion = {**configuracion_del_entorno(), **configuracion}
+        self._cluster = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def conectado(self):
+        return self._session is not None
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._conectar()
+        return self._session
+
+    @property
+    def cluster(self):
+        self.session
+        return self._cluster
+
+    def _conectar(self):
+        c = self.configuracion
+        cluster = Cluster(
+            c['hosts'],
+            port=c['puerto'],
+            # Optimizaciones de conexión
+            load_balancing_policy=None,
+            default_retry_policy=None,
+            compression=c['compresion'],
+            protocol_version=c['protocol_version'],
+            executor_threads=c['hilos_executor'],
+        )
+        if c['conexiones_por_host'] and c['protocol_version'] < 3:
+            minimo, maximo = c['conexiones_por_host']
+            cluster.set_core_connections_per_host(HostDistance.LOCAL, minimo)
+            cluster.set_max_connections_per_host(HostDistance.LOCAL, maximo)
+        elif c['conexiones_por_host']:
+            # Desde el protocolo 3 el driver abre una sola conexión por host y no admite cambiarlo
+            print(f"⚠️ conexiones_por_host se ignora con protocol_version {c['protocol_version']} "
+                  f"(solo aplica con 1 o 2)")
+        session = cluster.connect(c['keyspace'])
+
+        # Configurar timeouts y fetch size para mejor rendimiento
+        session.default_timeout = c['timeout']
+        session.default_fetch_size = c['fetch_size']
+        self._cluster, self._session = cluster, session
+
+    def configurar(self, **opciones):
+        """Cambia la configuración; si ya estaba conectado, reconecta en el próximo uso."""
+        with self._lock:
+            self.configuracion.update(opciones)
+        self.cerrar()
+
+    def cerrar(self):
+        with self._lock:
+            cluster, self._cluster, self._session = self._cluster, None, None
+        if cluster is not None:
+            cluster.shutdown()
+
+cliente = ClienteOLAP()
+
+def configurar(**opciones):
+    """Configura la conexión del módulo (hosts, puerto, keyspace, protocol_version, ...)."""
+    cliente.configurar(**opciones)
+
+def __getattr__(nombre):
+    # Compatibilidad: olap.session y olap.cluster conectan al usarse
+    if nombre in ('session', 'cluster'):
+        return getattr(cliente, nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+# Consultas del módulo: nombre -> CQL (se preparan una sola vez por sesión)
+CONSULTAS = {
+    'usuarios': "SELECT usuario_id, nombre FROM usuarios",
+    'canciones': "SELECT cancion_id, titulo FROM canciones",
+    'marcas_carga': "SELECT archivo, actualizado FROM marcas_carga",
+    'ciudad_genero_de_ciudad_y_genero': "SELECT ciudad, genero, reproducciones FROM reproducciones_por_ciudad_genero "
+                                        "WHERE ciudad = ? AND genero = ?",
+    # Top N por usuario: la clave de clustering ya ordena por reproducciones
+    'top_n_por_usuario': "SELECT id_usuario, id_cancion, total_reproducciones FROM top_canciones_por_usuario "
+                         "PER PARTITION LIMIT ?",
+    'top_n_de_usuario': "SELECT id_usuario, id_cancion, total_reproducciones FROM top_canciones_por_usuario "
+                        "WHERE id_usuario = ? LIMIT ?",
+}
+# Cada cubo del registro: lectura completa (nombre de la tabla) y, salvo en los
+# rankings, lectura de una partición (p. ej. genero_mes_de_genero, acotada por mes)
+CONSULTAS.update((cubo.tabla, cubo.select()) for cubo in CUBOS)
+CONSULTAS.update((cubo.nombre_particion, cubo.select_particion()) for cubo in CUBOS if not cubo.medida_en_clustering)
+
+TOP_N_POR_DEFECTO = 5
+
+# Límites de mes (AAAA-MM) cuando un filtro no acota el rango
+MES_MIN = '0000-00'
+MES_MAX = '9999-99'
+
+# Filas por página de cada consulta (las demás usan FILAS_POR_PAGINA_DEFECTO)
+FILAS_POR_PAGINA_DEFECTO = 1000
+FILAS_POR_PAGINA_CUBOS = 3000
+FILAS_POR_PAGINA_BOCETOS = 500    # Cada fila de un cubo de oyentes lleva hasta 2 KB de boceto
+FILAS_POR_PAGINA = {
+    'usuarios': 5000,
+    'canciones': 5000,
+    **{cubo.tabla: FILAS_POR_PAGINA_CUBOS for cubo in CUBOS},
+    'top_canciones_por_usuario': 2000,
+    'tendencia_por_dia': 5000,
+    **{cubo.tabla: FILAS_POR_PAGINA_BOCETOS for cubo in CUBOS_DISTINTOS},
+}
+
+class Pagina(namedtuple('Pagina', ['filas', 'estado'])):
+    """
+    Una página de resultados. estado es el paging state para reanudar la
+    consulta después de esta página (None si es la última).
+    """
+
+class RegistroSentencias:
+    """
+    Prepara cada consulta de CONSULTAS una sola vez por sesión y cuenta
+    preparaciones y ejecuciones por sentencia. Vuelve a preparar cuando
+    cambia el esquema de la tabla consultada, cuando el cliente abre una
+    sesión nueva (reconexión) o cuando el servidor rechaza la sentencia.
+    """
+
+    def __init__(self, cliente, consultas=CONSULTAS, filas_por_pagina=FILAS_POR_PAGINA):
+        self._cliente = cliente
+        self._sesion_actual = None
+        self._consultas = dict(consultas)
+        self._filas_por_pagina = dict(filas_por_pagina)
+        self._preparadas = {}          # nombre -> (sentencia, metadatos de la tabla)
+        self._lock = threading.RLock()
+        self.preparaciones = Counter()
+        self.ejecuciones = Counter()
+
+    def registrar(self, nombre, query, fetch_size=None):
+        """Añade (o reemplaza) una consulta con nombre y, opcionalmente, su tamaño de página."""
+        with self._lock:
+            self._consultas[nombre] = query
+            if fetch_size is not None:
+                self._filas_por_pagina[nombre] = fetch_size
+            self._preparadas.pop(nombre, None)
+
+    def _metadatos_tabla(self, query):
+        # TableMetadata actual de la tabla consultada; el driver lo reemplaza
+        # por un objeto nuevo cada vez que detecta un cambio de esquema
+        m = re.search(r"\bFROM\s+(\w+)", query, re.I)
+        try:
+            keyspace = self._session.cluster.metadata.keyspaces[self._session.keyspace]
+            return keyspace.tables.get(m.group(1)) if m else None
+        except (AttributeError, KeyError):
+            return None
+
+    @property
+    def _session(self):
+        session = self._cliente.session
+        if session is not self._sesion_actual:
+            # Sesión nueva (reconexión): lo preparado en la anterior no sirve
+            with self._lock:
+                self._preparadas.clear()
+                self._sesion_actual = session
+        return session
+
+    def invalidar(self, nombre=None):
+        """Obliga a volver a preparar una sentencia (o todas)."""
+        with self._lock:
+            if nombre is None:
+                self._preparadas.clear()
+            else:
+                self._preparadas.pop(nombre, None)
+
+    def _vigente(self, nombre):
+        """Sentencia ya preparada de nombre si sigue valiendo para la tabla, o None."""
+        with self._lock:
+            guardada = self._preparadas.get(nombre)
+            if guardada is not None and guardada[1] is self._metadatos_tabla(self._consultas[nombre]):
+                return guardada[0]
+        return None
+
+    def preparada(self, nombre):
+        """Devuelve la sentencia preparada de nombre, preparándola si hace falta."""
+        with self._lock:
+            query = self._consultas[nombre]
+            metadatos = self._metadatos_tabla(query)
+            guardada = self._preparadas.get(nombre)
+            if guardada is not None and guardada[1] is metadatos:
+                return guardada[0]
+            stmt = self._session.prepare(query)
+            stmt.fetch_size = self._filas_por_pagina.get(nombre, FILAS_POR_PAGINA_DEFECTO)
+            self._preparadas[nombre] = (stmt, metadatos)
+            self.preparaciones[nombre] += 1
+            return stmt
+
+    def contar(self, nombre, ejecuciones=1):
+        with self._lock:
+            self.ejecuciones[nombre] += ejecuciones
+
+    async def preparada_async(self, nombre):
+        """
+        Como preparada(), para asyncio: el driver solo conecta y prepara de
+        forma bloqueante, así que si hace falta conectar o preparar se hace
+        en el executor.
+        """
+        # Sin conexión, _vigente() conectaría dentro del loop
+        stmt = self._vigente(nombre) if self._cliente.conectado else None
+        if stmt is not None:
+            return stmt
+        return await asyncio.get_running_loop().run_in_executor(None, self.preparada, nombre)
+
+    @staticmethod
+    def _ligar_sentencia(stmt, parametros, fetch_size):
+        ligada = stmt.bind(parametros or ())
+        if fetch_size is not None:
+            ligada.fetch_size = fetch_size
+        return ligada
+
+    def _ligar(self, nombre, parametros, fetch_size):
+        return self._ligar_sentencia(self.preparada(nombre), parametros, fetch_size)
+
+    def ejecutar(self, nombre, parametros=None, fetch_size=None, **kwargs):
+        """
+        Ejecuta la sentencia preparada de nombre con su propio tamaño de página
+        (o fetch_size); reintenta una vez re-preparando.
+        """
+        self.contar(nombre)
+        try:
+            return self._session.execute(self._ligar(nombre, parametros, fetch_size), **kwargs)
+        except InvalidRequest:
+            self.invalidar(nombre)
+            return self._session.execute(self._ligar(nombre, parametros, fetch_size), **kwargs)
+
+    def paginas(self, nombre, parametros=None, fetch_size=None, paging_state=None):
+        """
+        Genera las páginas de la consulta a medida que llegan. La página
+        siguiente se pide antes de entregar la actual, así que se procesa
+        una mientras la otra viaja. Con paging_state se reanuda una consulta
+        desde el estado de una página anterior.
+        """
+        self.contar(nombre)
+        futuro = self._session.execute_async(self._ligar(nombre, parametros, fetch_size),
+                                             paging_state=paging_state)
+        while True:
+            with fase('red'):
+                resultado = futuro.result()
+            anotar_pagina()
+            pagina = Pagina(resultado.current_rows, resultado.paging_state)
+            if pagina.estado is not None:
+                futuro.start_fetching_next_page()
+            yield pagina
+            if pagina.estado is None:
+                return
+
+    def filas(self, nombre, parametros=None, fetch_size=None):
+        """Recorre todas las filas de la consulta página a página."""
+        for pagina in self.paginas(nombre, parametros, fetch_size):
+            yield from pagina.filas
+
+    async def paginas_async(self, nombre, parametros=None, fetch_size=None, paging_state=None):
+        """
+        Como paginas(), pero para asyncio: cada página del ResponseFuture del
+        driver se entrega al loop desde el hilo de E/S, sin bloquear hilos.
+        """
+        loop = asyncio.get_running_loop()
+        llegadas = asyncio.Queue()
+
+        def listo(_filas):
+            # La página ya llegó: result() no bloquea y trae el paging state
+            try:
+                llegada = (futuro.result(), None)
+            except Exception as e:
+                llegada = (None, e)
+            loop.call_soon_threadsafe(llegadas.put_nowait, llegada)
+
+        def fallo(error):
+            loop.call_soon_threadsafe(llegadas.put_nowait, (None, error))
+
+        self.contar(nombre)
+        ligada = self._ligar_sentencia(await self.preparada_async(nombre), parametros, fetch_size)
+        futuro = self._session.execute_async(ligada, paging_state=paging_state)
+        # Los callbacks se conservan y el driver los llama una vez por página
+        futuro.add_callbacks(listo, fallo)
+        while True:
+            with fase('red'):
+                resultado, error = await llegadas.get()
+            anotar_pagina()
+            if error is not None:
+                raise error
+            pagina = Pagina(resultado.current_rows, resultado.paging_state)
+            if pagina.estado is not None:
+                futuro.start_fetching_next_page()
+            yield pagina
+            if pagina.estado is None:
+                return
+
+    async def filas_async(self, nombre, parametros=None, fetch_size=None):
+        """Todas las filas de la consulta, leídas con paginas_async()."""
+        filas = []
+        async for pagina in self.paginas_async(nombre, parametros, fetch_size):
+            filas.extend(pagina.filas)
+        return filas
+
+    def ejecutar_lote(self, nombre, parametros):
+        """Ejecuta la sentencia con cada tupla de parametros de forma concurrente."""
+        parametros = list(parametros)
+        self.contar(nombre, len(parametros))
+        stmt = self.preparada(nombre)
+        with fase('red'):
+            resultados = execute_concurrent_with_args(self._session, stmt, parametros)
+        # Una página por partición leída
+        for _ in resultados:
+            anotar_pagina()
+        return resultados
+
+    def estadisticas(self):
+        """Preparaciones y ejecuciones de cada sentencia registrada."""
+        with self._lock:
+            return {nombre: {'preparaciones': self.preparaciones[nombre],
+                             'ejecuciones': self.ejecuciones[nombre]}
+                    for nombre in self._consultas}
+
+sentencias = RegistroSentencias(cliente)
+
+def paginas_consulta(nombre, parametros=None, fetch_size=None, paging_state=None):
+    """
+    Genera las páginas (filas, estado) de una consulta de CONSULTAS a medida
+    que llegan; estado permite reanudarla más tarde con paging_state.
+    """
+    return sentencias.paginas(nombre, parametros, fetch_size, paging_state)
+
+def estadisticas_consultas():
+    """Latencias p50/p95/p99 (total y por fase), filas, páginas y cache de cada consulta."""
+    return metricas.resumen()
+
+def volcar_metricas(ruta):
+    """Guarda estadisticas_consultas() en un archivo JSON."""
+    metricas.volcar(ruta)
+
+def estadisticas_sentencias():
+    """Uso de cada sentencia preparada del módulo."""
+    return sentencias.estadisticas()
 
 # Cache en memoria para datos frecuentemente consultados
-_cache = {}
-_cache_timeout = 300  # 5 minutos
+def _estimar_bytes(data):
+    """Tamaño aproximado de un resultado (lista de filas) a partir de su primera fila."""
+    if isinstance(data, (list, tuple)) and data:
+        fila = data[0]
+        por_fila = sys.getsizeof(fila)
+        if isinstance(fila, dict):
+            por_fila += sum(sys.getsizeof(v) for v in fila.values())
+        return sys.getsizeof(data) + por_fila * len(data)
+    return sys.getsizeof(data)
+
+class CacheResultados:
+    """
+    Cache LRU de resultados con vencimiento por entrada y límite de entradas
+    (y opcionalmente de bytes estimados). Es segura entre hilos y, con
+    obtener_o_calcular, varias llamadas simultáneas a la misma clave
+    comparten una única consulta en curso.
+    """
+
+    def __init__(self, ttl=300, max_entradas=128, max_bytes=None):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()     # clave -> (data, vence, bytes)
+        self._vuelos = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.compartidas = 0
+
+    def _quitar(self, clave):
+        _, _, tamano = self._entradas.pop(clave)
+        self._bytes -= tamano
+
+    def _buscar(self, clave):
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[1] <= time.time():
+            self._quitar(clave)
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None si no está o venció."""
+        with self._lock:
+            entrada = self._buscar(clave)
+            if entrada is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        anotar_cache('fallo' if entrada is None else 'acierto')
+        return None if entrada is None else entrada[0]
+
+    def guardar(self, clave, data, ttl=None):
+        tamano = _estimar_bytes(data) if self.max_bytes is not None else 0
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (data, time.time() + (self.ttl if ttl is None else ttl), tamano)
+            self._bytes += tamano
+            while len(self._entradas) > 1 and (
+                    len(self._entradas) > self.max_entradas
+                    or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._quitar(next(iter(self._entradas)))
+                self.desalojos += 1
+
+    def reservar(self, clave):
+        """
+        (entrada, vuelo, propio) de clave: la entrada vigente o, si falta, el
+        Future de la consulta en curso. propio indica que quien llama la
+        inicia y debe resolverla con terminar(); los demás esperan el Future.
+        """
+        vuelo, propio = None, False
+        with self._lock:
+            entrada = self._buscar(clave)
+            if entrada is not None:
+                self.aciertos += 1
+            else:
+                self.fallos += 1
+                vuelo = self._vuelos.get(clave)
+                propio = vuelo is None
+                if propio:
+                    vuelo = self._vuelos[clave] = Future()
+                else:
+                    self.compartidas += 1
+        anotar_cache('acierto' if entrada is not None else 'fallo' if propio else 'compartida')
+        return entrada, vuelo, propio
+
+    def terminar(self, clave, vuelo, resultado=None, error=None, ttl=None):
+        """Guarda el resultado de una consulta reservada (los errores no) y despierta a quienes esperan."""
+        try:
+            if error is None:
+                self.guardar(clave, resultado, ttl)
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            if error is None:
+                vuelo.set_result(resultado)
+            else:
+                vuelo.set_exception(error)
+
+    def obtener_o_calcular(self, clave, calcular, ttl=None):
+        """
+        Devuelve el valor de clave; si falta, lo calcula una sola vez aunque
+        lo pidan varios hilos (o corrutinas, ver _en_cache_async) a la vez.
+        Los errores no se guardan.
+        """
+        entrada, vuelo, propio = self.reservar(clave)
+        if entrada is not None:
+            return entrada[0]
+        if not propio:
+            return vuelo.result()
+        try:
+            resultado = calcular()
+        except BaseException as e:
+            self.terminar(clave, vuelo, error=e)
+            raise
+        self.terminar(clave, vuelo, resultado, ttl=ttl)
+        return resultado
+
+    def vigente(self, clave):
+        """Valor vigente de clave sin consultar nada más (None si no está o venció)."""
+        with self._lock:
+            entrada = self._buscar(clave)
+        return None if entrada is None else entrada[0]
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {'entradas': len(self._entradas), 'bytes_estimados': self._bytes,
+                    'aciertos': self.aciertos, 'fallos': self.fallos,
+                    'desalojos': self.desalojos, 'compartidas': self.compartidas}
+
+cache = CacheResultados(ttl=300)  # 5 minutos
 
 def get_from_cache(key):
     """Obtiene datos del cache si están disponibles y no han expirado."""
-    if key in _cache:
-        data, timestamp = _cache[key]
-        if time.time() - timestamp < _cache_timeout:
-            return data
-    return None
+    return cache.obtener(key)
 
 def set_cache(key, data):
     """Guarda datos en el cache."""
-    _cache[key] = (data, time.time())
+    cache.guardar(key, data)
 
 def clear_cache():
     """Limpia el cache."""
-    _cache.clear()
+    cache.limpiar()
+
+def estadisticas_cache():
+    """Aciertos, fallos, desalojos y consultas compartidas del cache."""
+    return cache.estadisticas()
+
+# Copia residente de las dimensiones usuarios y canciones
+class _Indice:
+    """
+    Textos indexados por id. Con ids densos se guardan en una lista
+    (posición = id); si son dispersos, en un diccionario.
+    """
+
+    def __init__(self, pares):
+        pares = list(pares)
+        maximo = max((i for i, _ in pares), default=-1)
+        minimo = min((i for i, _ in pares), default=0)
+        if minimo >= 0 and maximo < 2 * len(pares) + 1024:
+            self._lista = [None] * (maximo + 1)
+            for i, texto in pares:
+                self._lista[i] = texto
+            self._dict = None
+        else:
+            self._lista = None
+            self._dict = dict(pares)
+        self.cantidad = len(pares)
+
+    def get(self, i, defecto=None):
+        if self._dict is not None:
+            return self._dict.get(i, defecto)
+        if i is None or not 0 <= i < len(self._lista):
+            return defecto
+        texto = self._lista[i]
+        return defecto if texto is None else texto
+
+class DimensionesResidentes:
+    """
+    Copia en memoria de usuarios (id -> nombre) y canciones (id -> título)
+    para resolver nombres sin consultas por fila. Se carga con un escaneo
+    paginado y un hilo la renueva cada intervalo segundos o cuando cambia
+    la versión de las dimensiones registrada en marcas_carga.
+    """
+
+    ARCHIVOS_VERSION = ('usuarios.csv', 'canciones.csv')
+
+    def __init__(self, registro, intervalo=600, sondeo=30):
+        self._registro = registro
+        self.intervalo = intervalo
+        self.sondeo = sondeo
+        self._usuarios = None
+        self._canciones = None
+        self._version = None
+        self._cargada_en = 0
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _leer_version(self):
+        try:
+            filas = self._registro.ejecutar('marcas_carga')
+            return tuple(sorted((f.archivo, f.actualizado) for f in filas
+                                if f.archivo.replace('\\', '/').split('/')[-1] in self.ARCHIVOS_VERSION))
+        except Exception:
+            # Sin tabla de marcas solo se renueva por tiempo
+            return None
+
+    def cargar(self):
+        """Escanea ambas tablas y reemplaza la copia de una sola vez."""
+        inicio = time.time()
+        version = self._leer_version()
+        usuarios = _Indice((f.usuario_id, f.nombre) for f in self._registro.filas('usuarios'))
+        canciones = _Indice((f.cancion_id, f.titulo) for f in self._registro.filas('canciones'))
+        self._usuarios, self._canciones = usuarios, canciones
+        self._version = version
+        self._cargada_en = time.time()
+        print(f"Dimensiones en memoria: {usuarios.cantidad} usuarios y {canciones.cantidad} canciones "
+              f"({time.time() - inicio:.2f} s)")
+
+    @property
+    def cargada(self):
+        return self._usuarios is not None
+
+    def asegurar(self):
+        """Carga la copia la primera vez y arranca su renovación en segundo plano."""
+        if self._usuarios is None:
+            with self._lock:
+                if self._usuarios is None:
+                    self.cargar()
+        self.iniciar()
+
+    def _renovar(self):
+        while not self._detener.wait(self.sondeo):
+            try:
+                vencida = time.time() - self._cargada_en >= self.intervalo
+                if vencida or self._leer_version() != self._version:
+                    self.cargar()
+            except Exception as e:
+                print(f"Error al renovar dimensiones: {e}")
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._renovar, daemon=True)
+                self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def nombres_usuarios(self, usuario_ids):
+        self.asegurar()
+        usuarios = self._usuarios
+        return {uid: usuarios.get(uid, "Desconocido") for uid in usuario_ids}
+
+    def titulos_canciones(self, cancion_ids):
+        self.asegurar()
+        canciones = self._canciones
+        return {cid: canciones.get(cid, "Desconocida") for cid in cancion_ids}
+
+dimensiones = DimensionesResidentes(sentencias)
 
-# Función optimizada para obtener nombres de usuario en lote
 def obtener_nombres_usuarios_lote(usuario_ids):
     """
-    Obtiene nombres de usuarios en lote para mejor rendimiento.
+    Obtiene nombres de usuarios desde la copia residente, sin consultas por fila.
     """
     if not usuario_ids:
         return {}
-    
-    # Verificar cache primero
-    cache_key = f"usuarios_{hash(tuple(sorted(usuario_ids)))}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        # Preparar consulta
-        stmt = session.prepare("SELECT usuario_id, nombre FROM usuarios WHERE usuario_id = ?")
-        
-        # Ejecutar consultas concurrentes
-        futures = execute_concurrent_with_args(session, stmt, [(uid,) for uid in usuario_ids])
-        
-        resultado = {}
-        for success, result in futures:
-            if success and result:
-                row = result[0]  # Primer resultado
-                resultado[row.usuario_id] = row.nombre
-            
-        # Agregar usuarios no encontrados
-        for uid in usuario_ids:
-            if uid not in resultado:
-                resultado[uid] = "Desconocido"
-        
-        # Guardar en cache
-        set_cache(cache_key, resultado)
-        return resultado
-        
+        return dimensiones.nombres_usuarios(usuario_ids)
     except Exception as e:
         print(f"Error al obtener nombres de usuarios en lote: {e}")
         return {uid: "Desconocido" for uid in usuario_ids}
 
-# Función optimizada para obtener títulos de canciones en lote
 def obtener_titulos_canciones_lote(cancion_ids):
     """
-    Obtiene títulos de canciones en lote para mejor rendimiento.
+    Obtiene títulos de canciones desde la copia residente, sin consultas por fila.
     """
     if not cancion_ids:
         return {}
-    
-    # Verificar cache primero
-    cache_key = f"canciones_{hash(tuple(sorted(cancion_ids)))}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        # Preparar consulta
-        stmt = session.prepare("SELECT cancion_id, titulo FROM canciones WHERE cancion_id = ?")
-        
-        # Ejecutar consultas concurrentes
-        futures = execute_concurrent_with_args(session, stmt, [(cid,) for cid in cancion_ids])
-        
-        resultado = {}
-        for success, result in futures:
-            if success and result:
-                row = result[0]
-                resultado[row.cancion_id] = row.titulo
-            
-        # Agregar canciones no encontradas
-        for cid in cancion_ids:
-            if cid not in resultado:
-                resultado[cid] = "Desconocida"
-        
-        # Guardar en cache
-        set_cache(cache_key, resultado)
-        return resultado
-        
+        return dimensiones.titulos_canciones(cancion_ids)
     except Exception as e:
         print(f"Error al obtener títulos de canciones en lote: {e}")
         return {cid: "Desconocida" for cid in cancion_ids}
 
-# Consulta optimizada: top canciones por usuario
-def consultar_top_canciones_por_usuario_optimizado():
+# Resultados persistentes en disco (opcional, ver activar_almacen)
+DIRECTORIO_RESULTADOS = os.environ.get('SPOTIFY_OLAP_RESULTADOS') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.cache_olap')
+almacen = None
+_revalidando = set()
+_lock_revalidacion = threading.Lock()
+
+def activar_almacen(directorio=DIRECTORIO_RESULTADOS):
     """
-    Consulta optimizada de canciones más reproducidas por usuario.
+    Guarda en disco el resultado de cada cubo completo. En el siguiente
+    arranque se sirve desde ahí al instante y se revalida en segundo plano.
+    """
+    global almacen
+    almacen = AlmacenResultados(directorio)
+    return almacen
+
+def version_datos():
+    """
+    Versión de los datos cargados: resumen de las marcas que escribe el
+    cargador en marcas_carga. None si no se puede leer.
     """
-    cache_key = "top_canciones_por_usuario"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        print("Ejecutando consulta optimizada: top canciones por usuario...")
-        
-        # Configurar fetch size para esta consulta
-        session.default_fetch_size = 2000
-        rows = session.execute("SELECT * FROM top_canciones_por_usuario")
-        
-        # Extraer IDs únicos
-        usuario_ids = set()
-        cancion_ids = set()
-        datos_raw = []
-        
-        for row in rows:
-            usuario_ids.add(row.id_usuario)
-            cancion_ids.add(row.id_cancion)
-            datos_raw.append({
-                'id_usuario': row.id_usuario,
-                'id_cancion': row.id_cancion,
-                'reproducciones': row.total_reproducciones
-            })
-        
-        print(f"Datos obtenidos: {len(datos_raw)} registros")
-        
-        # Obtener nombres en lote (más eficiente)
+        return _resumen_marcas(sentencias.ejecutar('marcas_carga'))
+    except Exception:
+        return None
+
+async def version_datos_async():
+    try:
+        return _resumen_marcas(await sentencias.filas_async('marcas_carga'))
+    except Exception:
+        return None
+
+def _resumen_marcas(filas):
+    marcas = sorted((f.archivo, str(f.actualizado)) for f in filas)
+    return hashlib.sha1(repr(marcas).encode('utf-8')).hexdigest()
+
+def _clave_almacen(nombre):
+    return (cliente.configuracion['keyspace'], nombre)
+
+def _consultar_cubo(nombre, armar):
+    """Consulta el cubo en Cassandra y, si hay almacen, guarda el resultado en disco."""
+    version = version_datos() if almacen is not None else None
+    resultados = armar(sentencias.filas(nombre))
+    _guardar_en_almacen(nombre, version, resultados)
+    return resultados
+
+def _guardar_en_almacen(nombre, version, resultados):
+    if almacen is None:
+        return
+    try:
+        almacen.guardar(_clave_almacen(nombre), version, resultados)
+    except OSError as e:
+        print(f"No se pudo guardar {nombre} en disco: {e}")
+
+def _revalidar_en_segundo_plano(nombre, armar, version):
+    """Comprueba la versión de los datos y, si cambió, vuelve a consultar el cubo."""
+    with _lock_revalidacion:
+        if nombre in _revalidando:
+            return
+        _revalidando.add(nombre)
+
+    def revalidar():
+        try:
+            if version is not None and version_datos() == version:
+                return
+            cache.guardar(nombre, _consultar_cubo(nombre, armar))
+            print(f"Resultado de {nombre} actualizado desde Cassandra")
+        except Exception as e:
+            print(f"Error al revalidar {nombre}: {e}")
+        finally:
+            with _lock_revalidacion:
+                _revalidando.discard(nombre)
+    threading.Thread(target=revalidar, daemon=True).start()
+
+def _desde_almacen(nombre, armar):
+    """Resultado guardado en disco (revalidándolo en segundo plano) o None."""
+    if almacen is None:
+        return None
+    with fase('disco'):
+        guardado = almacen.leer(_clave_almacen(nombre))
+    if guardado is None:
+        return None
+    _revalidar_en_segundo_plano(nombre, armar, guardado.version)
+    return guardado.filas
+
+def _leer_cubo(nombre, armar):
+    """Lee el cubo nombre completo (consulta y clave de cache) y arma el resultado."""
+    def calcular():
+        guardado = _desde_almacen(nombre, armar)
+        return guardado if guardado is not None else _consultar_cubo(nombre, armar)
+    return cache.obtener_o_calcular(nombre, calcular)
+
+# Consulta optimizada: top canciones por usuario
+def _armar_top_canciones_por_usuario(rows):
+    print("Ejecutando consulta optimizada: top canciones por usuario...")
+    
+    # Extraer IDs únicos
+    usuario_ids = set()
+    cancion_ids = set()
+    datos_raw = []
+    
+    for row in rows:
+        usuario_ids.add(row.id_usuario)
+        cancion_ids.add(row.id_cancion)
+        datos_raw.append({
+            'id_usuario': row.id_usuario,
+            'id_cancion': row.id_cancion,
+            'reproducciones': row.total_reproducciones
+        })
+    
+    print(f"Datos obtenidos: {len(datos_raw)} registros")
+    
+    # Obtener nombres en lote (más eficiente)
+    with fase('nombres'):
         nombres_usuarios = obtener_nombres_usuarios_lote(usuario_ids)
         titulos_canciones = obtener_titulos_canciones_lote(cancion_ids)
+    
+    print("Procesando y ordenando datos...")
+    
+    # Construir resultado final
+    resultados = []
+    for dato in datos_raw:
+        nombre_usuario = nombres_usuarios.get(dato['id_usuario'], "Desconocido")
+        usuario_mostrar = f"{dato['id_usuario']} - {nombre_usuario}"
+        titulo_cancion = titulos_canciones.get(dato['id_cancion'], "Desconocida")
         
-        print("Procesando y ordenando datos...")
-        
-        # Construir resultado final
-        resultados = []
-        for dato in datos_raw:
-            nombre_usuario = nombres_usuarios.get(dato['id_usuario'], "Desconocido")
-            usuario_mostrar = f"{dato['id_usuario']} - {nombre_usuario}"
-            titulo_cancion = titulos_canciones.get(dato['id_cancion'], "Desconocida")
-            
-            resultados.append({
-                'usuario': usuario_mostrar,
-                'cancion': titulo_cancion,
-                'reproducciones': dato['reproducciones']
-            })
-        
-        # Ordenamiento optimizado usando key personalizada
+        resultados.append({
+            'usuario': usuario_mostrar,
+            'cancion': titulo_cancion,
+            'reproducciones': dato['reproducciones']
+        })
+    
+    # Ordenamiento optimizado usando key personalizada
+    with fase('orden'):
         resultados.sort(key=lambda x: (x['usuario'].lower(), x['cancion'].lower()))
-        
-        print(f"Consulta completada: {len(resultados)} registros procesados")
-        
-        # Guardar en cache
-        set_cache(cache_key, resultados)
-        # Restaurar fetch size por defecto
-        session.default_fetch_size = 1000
-        return resultados
-        
+    
+    print(f"Consulta completada: {len(resultados)} registros procesados")
+    
+    return resultados
+
+@instrumentada
+def consultar_top_canciones_por_usuario_optimizado():
+    """
+    Consulta optimizada de canciones más reproducidas por usuario.
+    """
+    try:
+        return _leer_cubo("top_canciones_por_usuario", _armar_top_canciones_por_usuario)
     except Exception as e:
+        anotar_error()
         print(f"Error en consulta optimizada top canciones por usuario: {e}")
         return []
 
-# Consulta optimizada: tendencia por día
-def consultar_tendencia_por_dia_optimizado():
+# Top N por usuario resuelto en el servidor
+def _leer_top_canciones(n, usuarios):
+    if usuarios is None:
+        # PER PARTITION LIMIT: el servidor devuelve solo n filas por usuario
+        filas = list(sentencias.filas('top_n_por_usuario', (n,)))
+        filas.sort(key=lambda fila: fila.id_usuario)  # estable: conserva el ranking
+    else:
+        filas = []
+        for exito, resultado in sentencias.ejecutar_lote('top_n_de_usuario', [(uid, n) for uid in usuarios]):
+            if not exito:
+                raise resultado
+            filas.extend(resultado)
+    return _armar_top_canciones(filas)
+
+def _armar_top_canciones(filas):
+    with fase('nombres'):
+        nombres_usuarios = obtener_nombres_usuarios_lote({fila.id_usuario for fila in filas})
+        titulos_canciones = obtener_titulos_canciones_lote({fila.id_cancion for fila in filas})
+
+    resultados = []
+    anterior, posicion = None, 0
+    for fila in filas:
+        posicion = posicion + 1 if fila.id_usuario == anterior else 1
+        anterior = fila.id_usuario
+        resultados.append({
+            'usuario': f"{fila.id_usuario} - {nombres_usuarios.get(fila.id_usuario, 'Desconocido')}",
+            'posicion': posicion,
+            'cancion': titulos_canciones.get(fila.id_cancion, "Desconocida"),
+            'reproducciones': fila.total_reproducciones
+        })
+    return resultados
+
+@instrumentada
+def consultar_top_canciones(n=TOP_N_POR_DEFECTO, usuarios=None):
     """
-    Consulta optimizada de tendencia por día.
+    Las n canciones más escuchadas de cada usuario, en el orden de la clave
+    de clustering (total_reproducciones DESC). usuarios puede ser un id, una
+    lista de ids o None (todos); se leen a lo sumo usuarios × n filas.
     """
-    cache_key = "tendencia_por_dia"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    if isinstance(usuarios, int):
+        usuarios = [usuarios]
+    usuarios = None if usuarios is None else tuple(usuarios)
     try:
-        print("Ejecutando consulta optimizada: tendencia por día...")
-        
-        # Configurar fetch size para esta consulta
-        session.default_fetch_size = 5000
-        rows = session.execute("SELECT * FROM tendencia_por_dia")
-        
-        resultados = []
-        for row in rows:
-            resultados.append({
-                'fecha': row.fecha,
-                'reproducciones': row.total_reproducciones
-            })
-        
-        # Ordenamiento por fecha (más eficiente que en Cassandra)
-        resultados.sort(key=lambda x: x['fecha'])
-        
+        return cache.obtener_o_calcular(('top_canciones', n, usuarios),
+                                        lambda: _leer_top_canciones(n, usuarios))
+    except Exception as e:
+        anotar_error()
+        print(f"Error en consulta de top {n} canciones por usuario: {e}")
+        return []
+
+# Consultas generadas desde el registro de cubos: por cada cubo aditivo hay
+# una función consultar_<tabla>_optimizado() (y consultar_<tabla>_async())
+def _clave_medida(cubo):
+    # Los conteos se entregan siempre como 'reproducciones' (p. ej. total_reproducciones)
+    return cubo.medida if cubo.distintos else 'reproducciones'
+
+def _fila_cubo(cubo, row):
+    fila = {d: getattr(row, cubo.columna(d)) for d in cubo.dimensiones}
+    fila[_clave_medida(cubo)] = getattr(row, cubo.medida)
+    return fila
+
+def _orden_cubo(cubo):
+    def clave(fila):
+        return tuple(fila[d].lower() if isinstance(fila[d], str) else fila[d] for d in cubo.dimensiones)
+    return clave
+
+def _armador(cubo):
+    """Función que convierte las filas del cubo en diccionarios ordenados por sus dimensiones."""
+    def armar(rows):
+        print(f"Ejecutando consulta optimizada: {cubo.tabla}...")
+        resultados = [_fila_cubo(cubo, row) for row in rows]
+        with fase('orden'):
+            resultados.sort(key=_orden_cubo(cubo))
         print(f"Consulta completada: {len(resultados)} registros")
-        
-        # Guardar en cache
-        set_cache(cache_key, resultados)
-        # Restaurar fetch size por defecto
-        session.default_fetch_size = 1000
         return resultados
-        
+    return armar
+
+ARMAR_CUBO = {cubo.nombre: _armador(cubo) for cubo in CUBOS if cubo.aditivo}
+
+def _consulta_cubo(cubo):
+    armar = ARMAR_CUBO[cubo.nombre]
+
+    def consultar():
+        try:
+            return _leer_cubo(cubo.tabla, armar)
+        except Exception as e:
+            anotar_error()
+            print(f"Error en consulta optimizada {cubo.tabla}: {e}")
+            return []
+    consultar.__name__ = consultar.__qualname__ = f"consultar_{cubo.tabla}_optimizado"
+    consultar.__doc__ = f"Consulta optimizada del cubo {cubo.tabla} ({' × '.join(cubo.dimensiones)})."
+    return instrumentada(consultar)
+
+CONSULTAS_CUBOS = {cubo.nombre: _consulta_cubo(cubo) for cubo in CUBOS if cubo.aditivo}
+globals().update((funcion.__name__, funcion) for funcion in CONSULTAS_CUBOS.values())
+
+def consultar_cubo(nombre):
+    """Filas completas del cubo nombre del registro (p. ej. 'ciudad_genero_mes')."""
+    return CONSULTAS_CUBOS[nombre]()
+
+def _columnas_cubo(cubo):
+    """{clave de las filas de _fila_cubo: columna de la tabla}."""
+    columnas = {d: cubo.columna(d) for d in cubo.dimensiones}
+    columnas[_clave_medida(cubo)] = cubo.medida
+    return columnas
+
+def consultar_particion_cubo(nombre, *particion, desde=None, hasta=None):
+    """
+    Una partición del cubo nombre (valores de su clave de partición). Si el
+    cubo se ordena primero por tiempo, desde y hasta acotan ese rango.
+    """
+    cubo = CUBOS_POR_NOMBRE[nombre]
+    parametros = particion + ((desde or MES_MIN, hasta or MES_MAX) if cubo.rango_particion else ())
+    try:
+        return _leer_particion(cubo.nombre_particion, parametros, _columnas_cubo(cubo))
     except Exception as e:
-        print(f"Error en consulta optimizada tendencia por día: {e}")
+        anotar_error()
+        print(f"Error en consulta de partición de {cubo.tabla}: {e}")
         return []
 
-# Consulta optimizada: reproducciones por artista por mes
-def consultar_reproducciones_por_artista_mes_optimizado():
+# Consultas filtradas: una lectura de partición en lugar de escanear el cubo
+def _leer_particion(nombre, parametros, columnas):
     """
-    Consulta optimizada de reproducciones por artista y mes.
+    Lee una partición con la consulta nombre y la guarda en cache por sus
+    parámetros. Las filas llegan ordenadas por la clave de clustering.
+    """
+    return cache.obtener_o_calcular((nombre,) + tuple(parametros),
+                                    lambda: _como_dicts(sentencias.filas(nombre, parametros), columnas))
+
+def _como_dicts(filas, columnas):
+    """columnas: nombres de columna o {clave del diccionario: columna}."""
+    if not isinstance(columnas, dict):
+        columnas = dict(zip(columnas, columnas))
+    return [{clave: getattr(fila, columna) for clave, columna in columnas.items()} for fila in filas]
+
+@instrumentada
+def consultar_reproducciones_por_genero_mes_filtrado(genero, desde=None, hasta=None):
+    """
+    Reproducciones de un género por mes, opcionalmente entre los meses
+    desde y hasta (AAAA-MM, inclusive).
     """
-    cache_key = "reproducciones_por_artista_mes"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        print("Ejecutando consulta optimizada: reproducciones por artista y mes...")
-        
-        # Configurar fetch size para esta consulta
-        session.default_fetch_size = 3000
-        rows = session.execute("SELECT * FROM reproducciones_por_artista_mes")
-        
-        resultados = []
-        for row in rows:
-            resultados.append({
-                'artista': row.artista,
-                'mes': row.mes,
-                'reproducciones': row.reproducciones
-            })
-        
-        # Ordenamiento optimizado con múltiples criterios
-        resultados.sort(key=lambda x: (x['artista'].lower(), x['mes']))
-        
-        print(f"Consulta completada: {len(resultados)} registros")
-        
-        # Guardar en cache
-        set_cache(cache_key, resultados)
-        # Restaurar fetch size por defecto
-        session.default_fetch_size = 1000
-        return resultados
-        
+        return _leer_particion('genero_mes_de_genero', (genero, desde or MES_MIN, hasta or MES_MAX),
+                               ('genero', 'mes', 'reproducciones'))
     except Exception as e:
-        print(f"Error en consulta optimizada reproducciones por artista por mes: {e}")
+        anotar_error()
+        print(f"Error en consulta filtrada por género: {e}")
         return []
 
-# Consulta optimizada: reproducciones por género por mes
-def consultar_reproducciones_por_genero_mes_optimizado():
+@instrumentada
+def consultar_reproducciones_por_artista_mes_filtrado(artista, desde=None, hasta=None):
     """
-    Consulta optimizada de reproducciones por género y mes.
+    Reproducciones de un artista por mes, opcionalmente entre los meses
+    desde y hasta (AAAA-MM, inclusive). Para un solo mes, desde = hasta.
     """
-    cache_key = "reproducciones_por_genero_mes"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        print("Ejecutando consulta optimizada: reproducciones por género y mes...")
-        
-        # Configurar fetch size para esta consulta
-        session.default_fetch_size = 3000
-        rows = session.execute("SELECT * FROM reproducciones_por_genero_mes")
-        
-        resultados = []
-        for row in rows:
-            resultados.append({
-                'genero': row.genero,
-                'mes': row.mes,
-                'reproducciones': row.reproducciones
-            })
-        
-        # Ordenamiento optimizado
-        resultados.sort(key=lambda x: (x['genero'].lower(), x['mes']))
-        
-        print(f"Consulta completada: {len(resultados)} registros")
-        
-        # Guardar en cache
-        set_cache(cache_key, resultados)
-        # Restaurar fetch size por defecto
-        session.default_fetch_size = 1000
-        return resultados
-        
+        return _leer_particion('artista_mes_de_artista', (artista, desde or MES_MIN, hasta or MES_MAX),
+                               ('artista', 'mes', 'reproducciones'))
+    except Exception as e:
+        anotar_error()
+        print(f"Error en consulta filtrada por artista: {e}")
+        return []
+
+@instrumentada
+def consultar_reproducciones_por_ciudad_genero_filtrado(ciudad, genero=None):
+    """Reproducciones de una ciudad por género, o de un solo género si se indica."""
+    try:
+        if genero is None:
+            return _leer_particion('ciudad_genero_de_ciudad', (ciudad,), ('ciudad', 'genero', 'reproducciones'))
+        return _leer_particion('ciudad_genero_de_ciudad_y_genero', (ciudad, genero),
+                               ('ciudad', 'genero', 'reproducciones'))
     except Exception as e:
-        print(f"Error en consulta optimizada reproducciones por género por mes: {e}")
+        anotar_error()
+        print(f"Error en consulta filtrada por ciudad: {e}")
         return []
 
-# Consulta optimizada: reproducciones por ciudad y género
-def consultar_reproducciones_por_ciudad_genero_optimizado():
+# Tendencia diaria por rango de fechas: una partición por mes, leídas a la vez
+TENDENCIAS = {None: 'tendencia_diaria', 'genero': 'tendencia_genero', 'ciudad': 'tendencia_ciudad'}
+
+def _meses(desde, hasta):
+    """Meses AAAA-MM que cubren las fechas desde..hasta (AAAA-MM-DD), en orden."""
+    anio, mes = int(desde[:4]), int(desde[5:7])
+    fin = (int(hasta[:4]), int(hasta[5:7]))
+    meses = []
+    while (anio, mes) <= fin:
+        meses.append(f"{anio:04d}-{mes:02d}")
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+def _lectura_tendencia(desde, hasta, genero, ciudad):
+    """Cubo de tendencia que corresponde a los filtros y parámetros de cada partición mensual."""
+    if genero is not None and ciudad is not None:
+        raise ValueError("La tendencia se divide por género o por ciudad, no por ambos")
+    dimension, valor = ('genero', genero) if genero is not None else ('ciudad', ciudad)
+    cubo = CUBOS_POR_NOMBRE[TENDENCIAS[dimension if valor is not None else None]]
+    prefijo = () if valor is None else (valor,)
+    return cubo, [prefijo + (mes, desde, hasta) for mes in _meses(desde, hasta)]
+
+def _armar_tendencia(cubo, particiones):
+    # Meses en orden y cada partición ordenada por fecha: no hace falta ordenar
+    return [_fila_cubo(cubo, row) for filas in particiones for row in filas]
+
+@instrumentada
+def consultar_tendencia(desde, hasta, genero=None, ciudad=None):
     """
-    Consulta optimizada de reproducciones por ciudad y género.
+    Reproducciones por día entre las fechas desde y hasta (AAAA-MM-DD,
+    inclusive), de un género o de una ciudad si se indica. Solo se leen las
+    particiones mensuales del rango, todas a la vez, y las filas llegan
+    ordenadas por fecha.
     """
-    cache_key = "reproducciones_por_ciudad_genero"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
     try:
-        print("Ejecutando consulta optimizada: reproducciones por ciudad y género...")
-        
-        # Configurar fetch size para esta consulta
-        session.default_fetch_size = 3000
-        rows = session.execute("SELECT * FROM reproducciones_por_ciudad_genero")
-        
-        resultados = []
-        for row in rows:
-            resultados.append({
-                'ciudad': row.ciudad,
-                'genero': row.genero,
-                'reproducciones': row.reproducciones
-            })
-        
-        # Ordenamiento optimizado
-        resultados.sort(key=lambda x: (x['ciudad'].lower(), x['genero'].lower()))
-        
-        print(f"Consulta completada: {len(resultados)} registros")
-        
-        # Guardar en cache
-        set_cache(cache_key, resultados)
-        # Restaurar fetch size por defecto
-        session.default_fetch_size = 1000
-        return resultados
-        
+        cubo, parametros = _lectura_tendencia(desde, hasta, genero, ciudad)
+
+        def leer():
+            particiones = []
+            for exito, resultado in sentencias.ejecutar_lote(cubo.nombre_particion, parametros):
+                if not exito:
+                    raise resultado
+                particiones.append(resultado)
+            return _armar_tendencia(cubo, particiones)
+        return cache.obtener_o_calcular(('tendencia', desde, hasta, genero, ciudad), leer)
     except Exception as e:
-        print(f"Error en consulta optimizada reproducciones por ciudad y género: {e}")
+        anotar_error()
+        print(f"Error en tendencia de {desde} a {hasta}: {e}")
+        return []
+
+# Roll-up y drill-down a partir de cubos más finos ya leídos
+NIVELES_TIEMPO = ('fecha', 'mes', 'trimestre', 'anio')
+
+def _trimestre(mes):
+    return f"{mes[:4]}-T{(int(mes[5:7]) - 1) // 3 + 1}"
+
+# Nivel de tiempo a partir de una fecha AAAA-MM-DD o un mes AAAA-MM
+DERIVAR_TIEMPO = {
+    'fecha': lambda valor: valor,
+    'mes': lambda valor: valor[:7],
+    'trimestre': lambda valor: _trimestre(valor[:7]),
+    'anio': lambda valor: valor[:4],
+}
+
+# Cubos de los que se derivan los agregados, en el orden del registro
+# (del más pequeño al más grande)
+CUBOS_ORIGEN = tuple(cubo for cubo in CUBOS if cubo.aditivo)
+
+def _deriva(cubo, dimension):
+    if dimension in cubo.dimensiones:
+        return True
+    return (cubo.tiempo is not None and dimension in NIVELES_TIEMPO
+            and NIVELES_TIEMPO.index(dimension) >= NIVELES_TIEMPO.index(cubo.tiempo))
+
+def _valor_dimension(fila, dimension):
+    if dimension in fila:
+        return fila[dimension]
+    return DERIVAR_TIEMPO[dimension](fila.get('fecha') or fila['mes'])
+
+def _lectura_particion(cubo, filtros):
+    """
+    (consulta, parámetros, columnas) de la partición de cubo si los filtros
+    fijan por igualdad todas las columnas de su clave de partición, o None.
+    """
+    valores = []
+    for dimension in cubo.particion:
+        valor = filtros.get(dimension)
+        if valor is None or isinstance(valor, (list, tuple, set, frozenset)):
+            return None
+        valores.append(valor)
+    parametros = tuple(valores) + ((MES_MIN, MES_MAX) if cubo.rango_particion else ())
+    return cubo.nombre_particion, parametros, _columnas_cubo(cubo)
+
+def _lectura_origen(origenes, filtros):
+    """Lectura de partición del primer cubo de origenes que los filtros permiten, o None."""
+    for origen in origenes:
+        lectura = _lectura_particion(origen, filtros)
+        if lectura is not None:
+            return lectura
+    return None
+
+def _elegir_origen(agrupar, filtros):
+    """
+    Cubos que pueden responder agrupar/filtros y, si alguno (o la partición
+    que fijan los filtros) ya está en memoria, sus filas.
+    """
+    origenes = [o for o in CUBOS_ORIGEN if all(_deriva(o, d) for d in set(agrupar) | set(filtros))]
+    if not origenes:
+        raise ValueError(f"Ningún cubo permite agrupar por {', '.join(agrupar)} con esos filtros")
+    en_memoria = []
+    for origen in origenes:
+        filas = cache.vigente(origen.tabla)
+        if filas is None:
+            lectura = _lectura_particion(origen, filtros)
+            if lectura is not None:
+                filas = cache.vigente((lectura[0],) + lectura[1])
+        if filas is not None:
+            en_memoria.append(filas)
+    if en_memoria:
+        anotar_cache('derivado')
+    return origenes, min(en_memoria, key=len) if en_memoria else None
+
+def _condiciones(filtros):
+    return [(d, set(v) if isinstance(v, (list, tuple, set, frozenset)) else {v}) for d, v in filtros.items()]
+
+def _ordenar(resultados, agrupar):
+    with fase('orden'):
+        resultados.sort(key=lambda x: tuple(str(x[d]).lower() for d in agrupar))
+    return resultados
+
+def _sumar(filas, agrupar, filtros):
+    """Suma reproducciones de filas por las dimensiones de agrupar, aplicando filtros."""
+    condiciones = _condiciones(filtros)
+    totales = Counter()
+    with fase('rollup'):
+        for fila in filas:
+            if all(_valor_dimension(fila, d) in valores for d, valores in condiciones):
+                totales[tuple(_valor_dimension(fila, d) for d in agrupar)] += fila['reproducciones']
+    return _ordenar([dict(zip(agrupar, clave), reproducciones=n) for clave, n in totales.items()], agrupar)
+
+@instrumentada
+def consultar_agregado(agrupar, filtros=None):
+    """
+    Reproducciones agrupadas por agrupar (genero, artista, ciudad, fecha,
+    mes, trimestre, anio) y filtradas por filtros ({dimensión: valor o
+    lista}). Se suman localmente desde el cubo más fino que ya esté en
+    memoria; si no hay ninguno, se lee de Cassandra una sola partición del
+    primer cubo cuya clave de partición fijen los filtros o, si ninguno, el
+    cubo más pequeño que sirva. Para el drill-down,
+    se filtra por el valor del nivel superior y se agrupa por el inferior
+    (p. ej. agrupar=('mes',), filtros={'anio': '2024'}).
+    """
+    agrupar = tuple(agrupar)
+    filtros = dict(filtros or {})
+    try:
+        origenes, filas = _elegir_origen(agrupar, filtros)
+        if filas is None:
+            lectura = _lectura_origen(origenes, filtros)
+            if lectura is not None:
+                filas = _leer_particion(*lectura)
+            else:
+                filas = _leer_cubo(origenes[0].tabla, ARMAR_CUBO[origenes[0].nombre])
+        return _sumar(filas, agrupar, filtros)
+    except Exception as e:
+        anotar_error()
+        print(f"Error en agregado por {', '.join(agrupar) or 'total'}: {e}")
+        return []
+
+# Oyentes distintos: unión de los bocetos HyperLogLog de las celdas
+def _origen_oyentes(agrupar, filtros):
+    """Primer cubo de oyentes que permite agrupar/filtrar por esas dimensiones."""
+    for cubo in CUBOS_DISTINTOS:
+        if all(_deriva(cubo, d) for d in set(agrupar) | set(filtros)):
+            return cubo
+    raise ValueError(f"Ningún cubo de oyentes permite agrupar por {', '.join(agrupar)} con esos filtros")
+
+def _lectura_bocetos(cubo, filtros):
+    """(consulta, parámetros, columnas) de la partición que fijan los filtros o del cubo completo."""
+    return _lectura_particion(cubo, filtros) or (cubo.tabla, (), _columnas_cubo(cubo))
+
+def _unir_bocetos(filas, cubo, agrupar, filtros):
+    """Une los bocetos de filas por las dimensiones de agrupar y estima los oyentes de cada grupo."""
+    condiciones = _condiciones(filtros)
+    bocetos = {}
+    with fase('rollup'):
+        for fila in filas:
+            if all(_valor_dimension(fila, d) in valores for d, valores in condiciones):
+                clave = tuple(_valor_dimension(fila, d) for d in agrupar)
+                boceto = HyperLogLog.desde_bytes(fila[cubo.medida])
+                if clave in bocetos:
+                    bocetos[clave].unir(boceto)
+                else:
+                    bocetos[clave] = boceto
+        resultados = [dict(zip(agrupar, clave), oyentes=b.estimar()) for clave, b in bocetos.items()]
+    return _ordenar(resultados, agrupar)
+
+@instrumentada
+def consultar_oyentes(agrupar, filtros=None):
+    """
+    Usuarios distintos que escucharon, agrupados por agrupar (genero,
+    artista, ciudad, mes, trimestre, anio) y filtrados por filtros, igual
+    que consultar_agregado. Es una estimación (error típico de ~2 %): se
+    unen los bocetos HyperLogLog de las celdas de un cubo de oyentes, sin
+    leer las escuchas. Con un filtro por la primera dimensión del cubo solo
+    se lee esa partición (p. ej. filtros={'genero': 'Rock'}).
+    """
+    agrupar = tuple(agrupar)
+    filtros = dict(filtros or {})
+    try:
+        cubo = _origen_oyentes(agrupar, filtros)
+        return _unir_bocetos(_leer_particion(*_lectura_bocetos(cubo, filtros)), cubo, agrupar, filtros)
+    except Exception as e:
+        anotar_error()
+        print(f"Error en oyentes por {', '.join(agrupar) or 'total'}: {e}")
         return []
 
 # Funciones auxiliares para obtener valores únicos (optimizadas)
 def obtener_generos_unicos_optimizado():
     """Obtiene géneros únicos de forma optimizada."""
     try:
-        datos = consultar_reproducciones_por_genero_mes_optimizado()
+        datos = consultar_cubo('genero_mes')
         generos = sorted(set(fila['genero'] for fila in datos))
         return generos
     except Exception as e:
+        anotar_error()
         print(f"Error al obtener géneros únicos: {e}")
         return ["Todos"]
 
 def obtener_artistas_unicos_optimizado():
     """Obtiene artistas únicos de forma optimizada."""
     try:
-        datos = consultar_reproducciones_por_artista_mes_optimizado()
+        datos = consultar_cubo('artista_mes')
         artistas = sorted(set(fila['artista'] for fila in datos))
         return artistas
     except Exception as e:
+        anotar_error()
         print(f"Error al obtener artistas únicos: {e}")
         return ["Todos"]
 
 def obtener_ciudades_unicas_optimizado():
     """Obtiene ciudades únicas de forma optimizada."""
     try:
-        datos = consultar_reproducciones_por_ciudad_genero_optimizado()
+        datos = consultar_cubo('ciudad_genero')
         ciudades = sorted(set(fila['ciudad'] for fila in datos))
         return ciudades
     except Exception as e:
+        anotar_error()
         print(f"Error al obtener ciudades únicas: {e}")
         return ["Todos"]
 
 def obtener_meses_unicos_optimizado():
     """Obtiene meses únicos de forma optimizada."""
     try:
-        datos = consultar_reproducciones_por_genero_mes_optimizado()
+        datos = consultar_cubo('genero_mes')
         meses_raw = sorted(set(fila['mes'] for fila in datos))
         return meses_raw
     except Exception as e:
+        anotar_error()
         print(f"Error al obtener meses únicos: {e}")
         return ["2024-01"]
 
 # Función para limpiar cache manualmente
 def limpiar_cache():
-    """Limpia el cache de consultas."""
+    """Limpia el cache de consultas (también los resultados guardados en disco)."""
     clear_cache()
+    if almacen is not None:
+        almacen.limpiar()
     print("Cache limpiado")
 
 # Funciones de compatibilidad con la interfaz original
 def consultar_reproducciones_por_genero_mes():
-    return consultar_reproducciones_por_genero_mes_optimizado()
+    return consultar_cubo('genero_mes')
 
 def consultar_reproducciones_por_artista_mes():
-    return consultar_reproducciones_por_artista_mes_optimizado()
+    return consultar_cubo('artista_mes')
 
 def consultar_reproducciones_por_ciudad_genero():
-    return consultar_reproducciones_por_ciudad_genero_optimizado()
+    return consultar_cubo('ciudad_genero')
 
 def consultar_top_canciones_por_usuario():
     return consultar_top_canciones_por_usuario_optimizado()
 
 def consultar_tendencia_por_dia():
-    return consultar_tendencia_por_dia_optimizado()
+    return consultar_cubo('tendencia')
+
+# API asyncio: las mismas consultas sin un hilo por consulta
+EN_VUELO_ASYNC = 64    # Consultas por partición simultáneas en los lotes asíncronos
+_tareas_async = set()  # Tareas que calculan una clave reservada (referencia fuerte)
+
+async def _en_cache_async(clave, calcular):
+    """
+    Versión asyncio de cache.obtener_o_calcular, con las mismas consultas en
+    curso: si la clave ya se está calculando (en otro hilo, otro loop o este)
+    se espera ese resultado; si no, una tarea la calcula para todos.
+    """
+    entrada, vuelo, propio = cache.reservar(clave)
+    if entrada is not None:
+        return entrada[0]
+    if propio:
+        tarea = asyncio.get_running_loop().create_task(calcular())
+        _tareas_async.add(tarea)
+
+        def terminar(t):
+            _tareas_async.discard(tarea)
+            if t.cancelled():
+                cache.terminar(clave, vuelo, error=asyncio.CancelledError())
+            else:
+                cache.terminar(clave, vuelo, None if t.exception() else t.result(), t.exception())
+        tarea.add_done_callback(terminar)
+    # shield: cancelar a quien espera no cancela el Future compartido
+    return await asyncio.shield(asyncio.wrap_future(vuelo))
+
+async def _en_executor(funcion, *args):
+    """Ejecuta funcion en el executor del loop, dentro de la medición en curso."""
+    contexto = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, contexto.run, funcion, *args)
+
+async def _o_vacio(corrutina, mensaje):
+    try:
+        return await corrutina
+    except Exception as e:
+        anotar_error()
+        print(f"{mensaje}: {e}")
+        return []
+
+async def _asegurar_dimensiones_async():
+    # Solo la primera carga de la copia residente usa un hilo
+    if not dimensiones.cargada:
+        await asyncio.get_running_loop().run_in_executor(None, dimensiones.asegurar)
+
+async def _leer_cubo_async(nombre, armar, con_nombres=False):
+    async def calcular():
+        # La lectura y escritura en disco van al executor para no frenar el loop
+        guardado = await _en_executor(_desde_almacen, nombre, armar)
+        if guardado is not None:
+            return guardado
+        version = await version_datos_async() if almacen is not None else None
+        filas = await sentencias.filas_async(nombre)
+        if con_nombres:
+            await _asegurar_dimensiones_async()
+        resultados = armar(filas)
+        if almacen is not None:
+            await _en_executor(_guardar_en_almacen, nombre, version, resultados)
+        return resultados
+    return await _en_cache_async(nombre, calcular)
+
+async def _leer_particion_async(nombre, parametros, columnas):
+    async def calcular():
+        return _como_dicts(await sentencias.filas_async(nombre, parametros), columnas)
+    return await _en_cache_async((nombre,) + tuple(parametros), calcular)
+
+@instrumentada
+async def consultar_particion_cubo_async(nombre, *particion, desde=None, hasta=None):
+    cubo = CUBOS_POR_NOMBRE[nombre]
+    parametros = particion + ((desde or MES_MIN, hasta or MES_MAX) if cubo.rango_particion else ())
+    return await _o_vacio(_leer_particion_async(cubo.nombre_particion, parametros, _columnas_cubo(cubo)),
+                          f"Error en consulta asíncrona de partición de {cubo.tabla}")
+
+async def _lote_async(nombre, lista_parametros):
+    """Ejecuta nombre con cada tupla de parámetros, a lo sumo EN_VUELO_ASYNC a la vez."""
+    semaforo = asyncio.Semaphore(EN_VUELO_ASYNC)
+
+    async def una(parametros):
+        async with semaforo:
+            return await sentencias.filas_async(nombre, parametros)
+    return await asyncio.gather(*(una(p) for p in lista_parametros))
+
+async def obtener_nombres_usuarios_lote_async(usuario_ids):
+    await _asegurar_dimensiones_async()
+    return obtener_nombres_usuarios_lote(usuario_ids)
+
+async def obtener_titulos_canciones_lote_async(cancion_ids):
+    await _asegurar_dimensiones_async()
+    return obtener_titulos_canciones_lote(cancion_ids)
+
+@instrumentada
+async def consultar_top_canciones_por_usuario_async():
+    return await _o_vacio(
+        _leer_cubo_async("top_canciones_por_usuario", _armar_top_canciones_por_usuario, con_nombres=True),
+        "Error en consulta asíncrona top canciones por usuario")
+
+def _consulta_cubo_async(cubo):
+    armar = ARMAR_CUBO[cubo.nombre]
+
+    async def consultar():
+        return await _o_vacio(_leer_cubo_async(cubo.tabla, armar), f"Error en consulta asíncrona {cubo.tabla}")
+    consultar.__name__ = consultar.__qualname__ = f"consultar_{cubo.tabla}_async"
+    return instrumentada(consultar)
+
+CONSULTAS_CUBOS_ASYNC = {cubo.nombre: _consulta_cubo_async(cubo) for cubo in CUBOS if cubo.aditivo}
+globals().update((funcion.__name__, funcion) for funcion in CONSULTAS_CUBOS_ASYNC.values())
+
+async def consultar_cubo_async(nombre):
+    return await CONSULTAS_CUBOS_ASYNC[nombre]()
+
+@instrumentada
+async def consultar_top_canciones_async(n=TOP_N_POR_DEFECTO, usuarios=None):
+    if isinstance(usuarios, int):
+        usuarios = [usuarios]
+    usuarios = None if usuarios is None else tuple(usuarios)
+
+    async def calcular():
+        if usuarios is None:
+            filas = await sentencias.filas_async('top_n_por_usuario', (n,))
+            filas.sort(key=lambda fila: fila.id_usuario)
+        else:
+            por_usuario = await _lote_async('top_n_de_usuario', [(uid, n) for uid in usuarios])
+            filas = [fila for filas_usuario in por_usuario for fila in filas_usuario]
+        await _asegurar_dimensiones_async()
+        return _armar_top_canciones(filas)
+    return await _o_vacio(_en_cache_async(('top_canciones', n, usuarios), calcular),
+                          f"Error en consulta asíncrona de top {n} canciones por usuario")
+
+@instrumentada
+async def consultar_reproducciones_por_genero_mes_filtrado_async(genero, desde=None, hasta=None):
+    return await _o_vacio(
+        _leer_particion_async('genero_mes_de_genero', (genero, desde or MES_MIN, hasta or MES_MAX),
+                              ('genero', 'mes', 'reproducciones')),
+        "Error en consulta asíncrona filtrada por género")
+
+@instrumentada
+async def consultar_reproducciones_por_artista_mes_filtrado_async(artista, desde=None, hasta=None):
+    return await _o_vacio(
+        _leer_particion_async('artista_mes_de_artista', (artista, desde or MES_MIN, hasta or MES_MAX),
+                              ('artista', 'mes', 'reproducciones')),
+        "Error en consulta asíncrona filtrada por artista")
+
+@instrumentada
+async def consultar_reproducciones_por_ciudad_genero_filtrado_async(ciudad, genero=None):
+    if genero is None:
+        consulta = _leer_particion_async('ciudad_genero_de_ciudad', (ciudad,), ('ciudad', 'genero', 'reproducciones'))
+    else:
+        consulta = _leer_particion_async('ciudad_genero_de_ciudad_y_genero', (ciudad, genero),
+                                         ('ciudad', 'genero', 'reproducciones'))
+    return await _o_vacio(consulta, "Error en consulta asíncrona filtrada por ciudad")
+
+@instrumentada
+async def consultar_tendencia_async(desde, hasta, genero=None, ciudad=None):
+    async def calcular():
+        cubo, parametros = _lectura_tendencia(desde, hasta, genero, ciudad)
+        return _armar_tendencia(cubo, await _lote_async(cubo.nombre_particion, parametros))
+    return await _o_vacio(_en_cache_async(('tendencia', desde, hasta, genero, ciudad), calcular),
+                          f"Error en tendencia asíncrona de {desde} a {hasta}")
+
+@instrumentada
+async def consultar_agregado_async(agrupar, filtros=None):
+    agrupar = tuple(agrupar)
+    filtros = dict(filtros or {})
+
+    async def calcular():
+        origenes, filas = _elegir_origen(agrupar, filtros)
+        if filas is None:
+            lectura = _lectura_origen(origenes, filtros)
+            if lectura is not None:
+                filas = await _leer_particion_async(*lectura)
+            else:
+                filas = await _leer_cubo_async(origenes[0].tabla, ARMAR_CUBO[origenes[0].nombre])
+        return _sumar(filas, agrupar, filtros)
+    return await _o_vacio(calcular(), f"Error en agregado asíncrono por {', '.join(agrupar) or 'total'}")
+
+@instrumentada
+async def consultar_oyentes_async(agrupar, filtros=None):
+    agrupar = tuple(agrupar)
+    filtros = dict(filtros or {})
+
+    async def calcular():
+        cubo = _origen_oyentes(agrupar, filtros)
+        filas = await _leer_particion_async(*_lectura_bocetos(cubo, filtros))
+        return _unir_bocetos(filas, cubo, agrupar, filtros)
+    return await _o_vacio(calcular(), f"Error en oyentes asíncrono por {', '.join(agrupar) or 'total'}")
+
+async def obtener_generos_unicos_async():
+    return sorted(set(fila['genero'] for fila in await consultar_cubo_async('genero_mes')))
+
+async def obtener_artistas_unicos_async():
+    return sorted(set(fila['artista'] for fila in await consultar_cubo_async('artista_mes')))
+
+async def obtener_ciudades_unicas_async():
+    return sorted(set(fila['ciudad'] for fila in await consultar_cubo_async('ciudad_genero')))
+
+async def obtener_meses_unicos_async():
+    return sorted(set(fila['mes'] for fila in await consultar_cubo_async('genero_mes')))
+
+# Cubos que consultar_cubos_async puede pedir por nombre
+CUBOS_ASYNC = dict(CONSULTAS_CUBOS_ASYNC, top_canciones=consultar_top_canciones_async)
+
+async def consultar_cubos_async(*cubos):
+    """
+    Consulta varios cubos de CUBOS_ASYNC a la vez en el mismo loop y devuelve
+    {cubo: filas}. Sin argumentos, los consulta todos.
+    """
+    cubos = cubos or tuple(CUBOS_ASYNC)
+    resultados = await asyncio.gather(*(CUBOS_ASYNC[cubo]() for cubo in cubos))
+    return dict(zip(cubos, resultados))
+
+def consultar_cubos(*cubos):
+    """Versión bloqueante de consultar_cubos_async para código sin loop propio."""
+    return asyncio.run(consultar_cubos_async(*cubos))
 
 # Función para pre-cargar datos en background
 def precargar_datos_background():
     """
     Pre-carga datos en background para mejorar la experiencia del usuario.
+    Es opcional: importar el módulo no la inicia.
     """
     def cargar():
         try:
             print("Pre-cargando datos en background...")
-            consultar_reproducciones_por_genero_mes_optimizado()
-            consultar_reproducciones_por_artista_mes_optimizado()
-            consultar_reproducciones_por_ciudad_genero_optimizado()
+            # Los tres cubos de los filtros, a la vez y en un solo hilo
+            consultar_cubos('genero_mes', 'artista_mes', 'ciudad_genero')
             print("Pre-carga completada")
         except Exception as e:
             print(f"Error en pre-carga: {e}")
@@ -426,7 +1544,3 @@ def precargar_datos_background():
     # Ejecutar en thread separado
     thread = threading.Thread(target=cargar, daemon=True)
     thread.start()
-
-# Inicializar pre-carga al importar el módulo
-if __name__ != "__main__":
-    precargar_datos_background()
\ No newline at end of file
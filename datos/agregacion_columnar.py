@@ -0,0 +1,228 @@
+import csv
+
+import numpy as np
+
+from cubos_olap import CUBOS, fecha_texto, mes_texto
+from hyperloglog import BITS_RESTO, PRECISION, REGISTROS, HyperLogLog
+
+# Bytes de escuchas.csv leídos por bloque
+BYTES_POR_BLOQUE = 16 * 1024 * 1024
+# Resultados parciales acumulados antes de combinarlos
+PARCIALES_POR_MEZCLA = 32
+
+DESCONOCIDO = 'desconocido'
+
+# Bocetos de oyentes: cada escucha se empaqueta como celda | registro | rango
+BITS_RANGO = 6
+BITS_REGISTRO = PRECISION + BITS_RANGO
+
+def _codificar_dimension(valores_por_id):
+    """
+    Convierte {id: texto} en un array indexado por id con el código de cada
+    texto, más la lista de textos. Los ids sin valor apuntan a 'desconocido'.
+    """
+    textos = [DESCONOCIDO]
+    codigos = {DESCONOCIDO: 0}
+    tamano = max(valores_por_id, default=-1) + 1
+    por_id = np.zeros(max(tamano, 1), dtype=np.int64)
+    for id_, texto in valores_por_id.items():
+        codigo = codigos.get(texto)
+        if codigo is None:
+            codigo = codigos[texto] = len(textos)
+            textos.append(texto)
+        por_id[id_] = codigo
+    return por_id, textos
+
+def _buscar(por_id, ids):
+    """Join por id contra un array de dimensión; ids fuera de rango -> desconocido."""
+    validos = (ids >= 0) & (ids < len(por_id))
+    return np.where(validos, por_id[np.where(validos, ids, 0)], 0).astype(np.int64, copy=False)
+
+def _bloques_de_lineas(f, bytes_por_bloque):
+    """Lee f por bloques que siempre terminan en una línea completa."""
+    resto = b''
+    while True:
+        datos = f.read(bytes_por_bloque)
+        if not datos:
+            if resto:
+                yield resto
+            return
+        datos = resto + datos
+        corte = datos.rfind(b'\n')
+        if corte < 0:
+            resto = datos
+            continue
+        resto = datos[corte + 1:]
+        yield datos[:corte + 1]
+
+def leer_bloques_escuchas(archivo, bytes_por_bloque=BYTES_POR_BLOQUE):
+    """
+    Lee archivo por bloques de líneas completas y devuelve, para cada bloque,
+    arrays de usuario, canción y fecha codificada como AAAAMMDD.
+    """
+    with open(archivo, 'rb') as f:
+        columnas = next(csv.reader([f.readline().decode('utf-8')]))
+        # La fecha se separa en tres números (año, mes, día)
+        campos = []
+        for columna in columnas:
+            campos.extend([columna + '_anio', columna + '_mes', columna + '_dia']
+                          if columna == 'fecha_escucha' else [columna])
+        i_usuario = campos.index('usuario_id')
+        i_cancion = campos.index('cancion_id')
+        i_anio = campos.index('fecha_escucha_anio')
+
+        for datos in _bloques_de_lineas(f, bytes_por_bloque):
+            texto = datos.replace(b'\r', b'').replace(b'-', b',').replace(b'\n', b',').strip(b',')
+            if not texto:
+                continue
+            numeros = np.fromstring(texto.decode('ascii'), dtype=np.int64, sep=',')
+            if len(numeros) % len(campos):
+                raise ValueError(f"{archivo}: bloque con columnas incompletas")
+            tabla = numeros.reshape(-1, len(campos))
+            fechas = tabla[:, i_anio] * 10000 + tabla[:, i_anio + 1] * 100 + tabla[:, i_anio + 2]
+            yield tabla[:, i_usuario], tabla[:, i_cancion], fechas
+
+def _contar(claves):
+    return np.unique(claves, return_counts=True)
+
+def _combinar(parciales):
+    """Suma una lista de pares (claves, conteos) en un solo par."""
+    claves = np.concatenate([c for c, _ in parciales])
+    conteos = np.concatenate([n for _, n in parciales])
+    unicas, inversa = np.unique(claves, return_inverse=True)
+    return unicas, np.bincount(inversa, weights=conteos, minlength=len(unicas)).astype(np.int64)
+
+def _hash64(valores):
+    """hyperloglog.hash64 vectorizado (la aritmética de uint64 descarta el desborde)."""
+    z = valores.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _registros(user_ids):
+    """Registro y rango de cada usuario, como hyperloglog.posicion()."""
+    h = _hash64(user_ids)
+    indices = (h >> np.uint64(BITS_RESTO)).astype(np.int64)
+    # El resto tiene menos de 53 bits: como float es exacto y frexp da su bit_length
+    _, bits = np.frexp((h & np.uint64((1 << BITS_RESTO) - 1)).astype(np.float64))
+    return indices, BITS_RESTO - bits.astype(np.int64) + 1
+
+def _maximos(valores):
+    """De los valores celda | registro | rango, deja el de mayor rango de cada registro."""
+    valores = np.unique(valores)
+    grupos = valores >> BITS_RANGO
+    ultimo = np.ones(len(valores), dtype=bool)
+    ultimo[:-1] = grupos[1:] != grupos[:-1]
+    return valores[ultimo]
+
+def _bocetos(valores):
+    """Separa los valores celda | registro | rango en celdas y un HyperLogLog por celda."""
+    celdas = valores >> BITS_REGISTRO
+    registros = ((valores >> BITS_RANGO) & (REGISTROS - 1)).tolist()
+    rangos = (valores & ((1 << BITS_RANGO) - 1)).tolist()
+    inicios = np.flatnonzero(np.r_[True, celdas[1:] != celdas[:-1]]) if len(celdas) else celdas
+    limites = inicios.tolist() + [len(celdas)]
+    bocetos = [HyperLogLog.desde_pares(registros[a:b], rangos[a:b]) for a, b in zip(limites, limites[1:])]
+    return celdas[inicios], bocetos
+
+class DimensionesCodificadas:
+    """Dimensiones de usuarios y canciones como arrays de códigos indexados por id."""
+
+    def __init__(self, ciudad_por_usuario, ciudades, artista_por_cancion, artistas,
+                 genero_por_cancion, generos):
+        self.ciudad_por_usuario = ciudad_por_usuario
+        self.ciudades = ciudades
+        self.artista_por_cancion = artista_por_cancion
+        self.artistas = artistas
+        self.genero_por_cancion = genero_por_cancion
+        self.generos = generos
+
+def codificar_dimensiones(usuarios, canciones):
+    """Codifica los mapas de cargar_dimensiones() como DimensionesCodificadas."""
+    ciudad_por_usuario, ciudades = _codificar_dimension(usuarios)
+    artista_por_cancion, artistas = _codificar_dimension({k: v['artista'] for k, v in canciones.items()})
+    genero_por_cancion, generos = _codificar_dimension({k: v['genero'] for k, v in canciones.items()})
+    return DimensionesCodificadas(ciudad_por_usuario, ciudades, artista_por_cancion, artistas,
+                                  genero_por_cancion, generos)
+
+def agregar_columnar(archivo, usuarios, canciones, bytes_por_bloque=BYTES_POR_BLOQUE):
+    """
+    Calcula los agregados OLAP con operaciones vectorizadas.
+    Las escuchas se leen por bloques como arrays de enteros, el mes se
+    obtiene con aritmética sobre la fecha AAAAMMDD y las dimensiones se
+    unen con arrays indexados por id. Los conteos por grupo se calculan
+    con np.unique/np.bincount sobre claves enteras combinadas.
+    Devuelve un diccionario con la misma forma que nuevos_agregados().
+    """
+    return agregar_bloques(leer_bloques_escuchas(archivo, bytes_por_bloque),
+                           codificar_dimensiones(usuarios, canciones))
+
+def _bits(textos):
+    return max(1, (len(textos) - 1).bit_length())
+
+def agregar_bloques(bloques, dimensiones):
+    """
+    Calcula los agregados de todos los cubos a partir de bloques (usuarios,
+    canciones, fechas AAAAMMDD) y de unas DimensionesCodificadas. La clave
+    de cada cubo se empaqueta en un int64 según cubo.empaquetado(); en los
+    cubos de oyentes se le agregan a la derecha el registro y el rango
+    HyperLogLog del usuario y se conserva el máximo por registro.
+    """
+    textos = {'ciudad': dimensiones.ciudades, 'artista': dimensiones.artistas, 'genero': dimensiones.generos}
+    bits = {dimension: _bits(valores) for dimension, valores in textos.items()}
+    empaquetados = {cubo.nombre: cubo.empaquetado(bits, BITS_REGISTRO if cubo.distintos else 0)
+                    for cubo in CUBOS}
+    parciales = {cubo.nombre: [] for cubo in CUBOS}
+
+    for user_ids, song_ids, fechas in bloques:
+        user_ids = user_ids.astype(np.int64, copy=False)
+        song_ids = song_ids.astype(np.int64, copy=False)
+        fechas = fechas.astype(np.int64, copy=False)
+        columnas = {
+            'usuario': user_ids,
+            'cancion': song_ids,
+            'fecha': fechas,
+            'mes': fechas // 100,
+            'ciudad': _buscar(dimensiones.ciudad_por_usuario, user_ids),
+            'artista': _buscar(dimensiones.artista_por_cancion, song_ids),
+            'genero': _buscar(dimensiones.genero_por_cancion, song_ids),
+        }
+        registros, rangos = _registros(user_ids)
+
+        for cubo in CUBOS:
+            claves = None
+            for dimension, (desplazamiento, _) in zip(cubo.dimensiones, empaquetados[cubo.nombre]):
+                parte = columnas[dimension] << desplazamiento
+                claves = parte if claves is None else claves | parte
+            lista = parciales[cubo.nombre]
+            if cubo.distintos:
+                lista.append(_maximos((claves << BITS_REGISTRO) | (registros << BITS_RANGO) | rangos))
+                if len(lista) >= PARCIALES_POR_MEZCLA:
+                    parciales[cubo.nombre] = [_maximos(np.concatenate(lista))]
+                continue
+            lista.append(_contar(claves))
+            if len(lista) >= PARCIALES_POR_MEZCLA:
+                parciales[cubo.nombre] = [_combinar(lista)]
+
+    decodificar = {'fecha': fecha_texto, 'mes': mes_texto}
+    agregados = {}
+    for cubo in CUBOS:
+        lista = parciales[cubo.nombre]
+        if cubo.distintos:
+            claves, medidas = _bocetos(_maximos(np.concatenate(lista)) if lista else np.zeros(0, dtype=np.int64))
+        elif lista:
+            claves, conteos = _combinar(lista)
+            medidas = conteos.tolist()
+        else:
+            claves, medidas = np.zeros(0, dtype=np.int64), []
+        valores = []
+        for dimension, (desplazamiento, mascara) in zip(cubo.dimensiones, empaquetados[cubo.nombre]):
+            codigos = ((claves >> desplazamiento) & mascara).tolist()
+            if dimension in textos:
+                valores.append([textos[dimension][c] for c in codigos])
+            elif dimension in decodificar:
+                valores.append([decodificar[dimension](c) for c in codigos])
+            else:
+                valores.append(codigos)
+        agregados[cubo.nombre] = dict(zip(zip(*valores), medidas))
+    return agregados
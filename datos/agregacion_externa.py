@@ -0,0 +1,266 @@
+import heapq
+import os
+import struct
+import tempfile
+from array import array
+
+from cubos_olap import CUBOS, CUBOS_CONTEO, CUBOS_DISTINTOS, fecha_texto, mes_texto
+from hyperloglog import BYTES_EN_MEMORIA, HyperLogLog
+
+# Estimación del coste en memoria de cada entrada de un dict int -> int
+BYTES_POR_ENTRADA = 100
+# Pares (clave, conteo) leídos de una vez de cada volcado durante la mezcla
+PARES_POR_LECTURA = 8192
+# Un boceto se cuenta en el presupuesto por su coste máximo en memoria
+ENTRADAS_POR_BOCETO = -(-BYTES_EN_MEMORIA // BYTES_POR_ENTRADA)
+# Cabecera de cada boceto volcado: clave y longitud del blob
+CABECERA_BOCETO = struct.Struct('<qH')
+BYTES_POR_LECTURA = 1 << 20
+
+class Codificador:
+    """Asigna un entero compacto a cada valor de texto de una dimensión."""
+
+    def __init__(self):
+        self.codigos = {}
+        self.valores = []
+
+    def codificar(self, valor):
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.codigos[valor] = codigo
+            self.valores.append(valor)
+        return codigo
+
+    def decodificar(self, codigo):
+        return self.valores[codigo]
+
+class ContadorExterno:
+    """
+    Contador con claves enteras que vuelca a disco ejecuciones ordenadas
+    cuando se le pide y las mezcla al recorrerlo.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.conteos = {}
+        self.volcados = []
+
+    def sumar(self, clave, cantidad=1):
+        self.conteos[clave] = self.conteos.get(clave, 0) + cantidad
+
+    def __len__(self):
+        return len(self.conteos)
+
+    def volcar(self):
+        """Escribe los conteos en memoria, ordenados por clave, y los libera."""
+        if not self.conteos:
+            return
+        pares = array('q')
+        for clave in sorted(self.conteos):
+            pares.append(clave)
+            pares.append(self.conteos[clave])
+        fd, ruta = tempfile.mkstemp(suffix='.agg', dir=self.directorio)
+        with os.fdopen(fd, 'wb') as f:
+            pares.tofile(f)
+        self.volcados.append(ruta)
+        self.conteos = {}
+
+    def _leer_volcado(self, ruta):
+        with open(ruta, 'rb') as f:
+            while True:
+                pares = array('q')
+                try:
+                    pares.fromfile(f, PARES_POR_LECTURA * 2)
+                except EOFError:
+                    # fromfile deja cargados los elementos que sí pudo leer
+                    pass
+                if not pares:
+                    break
+                for i in range(0, len(pares), 2):
+                    yield pares[i], pares[i + 1]
+
+    def items(self):
+        """Recorre (clave, conteo) en orden de clave sumando todas las ejecuciones."""
+        fuentes = [self._leer_volcado(ruta) for ruta in self.volcados]
+        fuentes.append(iter(sorted(self.conteos.items())))
+        clave_actual = None
+        total = 0
+        for clave, conteo in heapq.merge(*fuentes):
+            if clave != clave_actual:
+                if clave_actual is not None:
+                    yield clave_actual, total
+                clave_actual = clave
+                total = 0
+            total += conteo
+        if clave_actual is not None:
+            yield clave_actual, total
+
+class BocetosExternos:
+    """
+    Como ContadorExterno, para los bocetos de oyentes: cada volcado guarda
+    los bocetos serializados en orden de clave y al recorrerlos se unen los
+    de la misma clave. Su tamaño se mide en entradas de conteo equivalentes.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.bocetos = {}
+        self.volcados = []
+
+    def agregar(self, clave, valor):
+        boceto = self.bocetos.get(clave)
+        if boceto is None:
+            boceto = self.bocetos[clave] = HyperLogLog()
+        boceto.agregar(valor)
+
+    def __len__(self):
+        return len(self.bocetos) * ENTRADAS_POR_BOCETO
+
+    def volcar(self):
+        """Escribe los bocetos en memoria, ordenados por clave, y los libera."""
+        if not self.bocetos:
+            return
+        fd, ruta = tempfile.mkstemp(suffix='.hll', dir=self.directorio)
+        with os.fdopen(fd, 'wb') as f:
+            for clave in sorted(self.bocetos):
+                blob = bytes(self.bocetos[clave])
+                f.write(CABECERA_BOCETO.pack(clave, len(blob)))
+                f.write(blob)
+        self.volcados.append(ruta)
+        self.bocetos = {}
+
+    def _leer_volcado(self, ruta):
+        with open(ruta, 'rb', buffering=BYTES_POR_LECTURA) as f:
+            while True:
+                cabecera = f.read(CABECERA_BOCETO.size)
+                if not cabecera:
+                    return
+                clave, largo = CABECERA_BOCETO.unpack(cabecera)
+                yield clave, HyperLogLog.desde_bytes(f.read(largo))
+
+    def items(self):
+        """Recorre (clave, boceto) en orden de clave uniendo todas las ejecuciones."""
+        fuentes = [self._leer_volcado(ruta) for ruta in self.volcados]
+        fuentes.append((clave, self.bocetos[clave]) for clave in sorted(self.bocetos))
+        clave_actual = None
+        total = None
+        for clave, boceto in heapq.merge(*fuentes, key=lambda par: par[0]):
+            if clave != clave_actual:
+                if clave_actual is not None:
+                    yield clave_actual, total
+                clave_actual = clave
+                # Boceto nuevo: no se modifican los que siguen en memoria
+                total = HyperLogLog()
+            total.unir(boceto)
+        if clave_actual is not None:
+            yield clave_actual, total
+
+class VistaAgregado:
+    """Expone un ContadorExterno (o BocetosExternos) con las claves originales de la dimensión."""
+
+    def __init__(self, contador, decodificar):
+        self.contador = contador
+        self.decodificar = decodificar
+
+    def items(self):
+        for clave, conteo in self.contador.items():
+            yield self.decodificar(clave), conteo
+
+def _bits(codificador):
+    return max(1, (len(codificador.valores) - 1).bit_length())
+
+def agregar_con_memoria_acotada(escuchas, usuarios, canciones, memoria_mb, directorio=None):
+    """
+    Calcula los agregados OLAP sin superar aproximadamente memoria_mb en
+    conteos. Cada clave se empaqueta en un entero (las dimensiones de texto
+    como códigos de diccionario, las fechas como AAAAMMDD) y, cuando los
+    conteos en memoria superan el presupuesto, el contador más grande se
+    vuelca ordenado a disco. Al recorrer el resultado, los volcados se mezclan.
+
+    Devuelve un diccionario con la misma forma que nuevos_agregados(), apto
+    para filas_olap(), y el directorio temporal que el llamador debe borrar
+    con limpiar_agregados(). Los bocetos de oyentes de los cubos distintos
+    cuentan en el presupuesto por su tamaño máximo en memoria y también se
+    vuelcan a disco.
+    """
+    directorio = tempfile.mkdtemp(prefix='olap_', dir=directorio)
+    max_entradas = max(1, memoria_mb * 1024 * 1024 // BYTES_POR_ENTRADA)
+
+    codificadores = {'ciudad': Codificador(), 'artista': Codificador(), 'genero': Codificador()}
+    ciudades = codificadores['ciudad']
+    artistas = codificadores['artista']
+    generos = codificadores['genero']
+    dia_de_fecha = {}
+
+    # Dimensiones codificadas una sola vez por usuario y por canción
+    ciudad_de_usuario = {uid: ciudades.codificar(ciudad) for uid, ciudad in usuarios.items()}
+    info_de_cancion = {
+        sid: (artistas.codificar(info['artista']), generos.codificar(info['genero']))
+        for sid, info in canciones.items()
+    }
+    ciudad_desconocida = ciudades.codificar('desconocido')
+    cancion_desconocida = (artistas.codificar('desconocido'), generos.codificar('desconocido'))
+
+    # Todos los textos ya están codificados: se conocen los bits de cada dimensión
+    bits = {dimension: _bits(codificador) for dimension, codificador in codificadores.items()}
+    contadores = {cubo.nombre: ContadorExterno(directorio) for cubo in CUBOS_CONTEO}
+    bocetos = {cubo.nombre: BocetosExternos(directorio) for cubo in CUBOS_DISTINTOS}
+    volcables = list(contadores.values()) + list(bocetos.values())
+
+    def desplazamientos(cubo):
+        return [(indice, desplazamiento) for indice, (desplazamiento, _) in
+                zip(cubo.indices, cubo.empaquetado(bits))]
+    empaquetados = [(contadores[cubo.nombre], desplazamientos(cubo)) for cubo in CUBOS_CONTEO]
+    empaquetados_bocetos = [(bocetos[cubo.nombre], desplazamientos(cubo)) for cubo in CUBOS_DISTINTOS]
+
+    procesadas = 0
+    for user_id, fecha, song_id in escuchas:
+        ciudad = ciudad_de_usuario.get(user_id, ciudad_desconocida)
+        artista, genero = info_de_cancion.get(song_id, cancion_desconocida)
+        dia = dia_de_fecha.get(fecha)
+        if dia is None:
+            dia = dia_de_fecha[fecha] = int(fecha[:4]) * 10000 + int(fecha[5:7]) * 100 + int(fecha[8:10])
+        valores = (user_id, song_id, dia, dia // 100, ciudad, artista, genero)
+
+        for contador, partes in empaquetados:
+            clave = 0
+            for indice, desplazamiento in partes:
+                clave |= valores[indice] << desplazamiento
+            contador.sumar(clave)
+        for bocetos_cubo, partes in empaquetados_bocetos:
+            clave = 0
+            for indice, desplazamiento in partes:
+                clave |= valores[indice] << desplazamiento
+            bocetos_cubo.agregar(clave, user_id)
+
+        procesadas += 1
+        if procesadas % 10000 == 0:
+            while sum(len(c) for c in volcables) > max_entradas:
+                max(volcables, key=len).volcar()
+
+    volcados = sum(len(c.volcados) for c in volcables)
+    if volcados:
+        print(f"💾 Agregación: {procesadas} escuchas, {volcados} volcados a disco")
+
+    textos = {'fecha': fecha_texto, 'mes': mes_texto}
+    textos.update((dimension, codificador.decodificar) for dimension, codificador in codificadores.items())
+
+    def decodificador(cubo):
+        partes = [(desplazamiento, mascara, textos.get(dimension))
+                  for dimension, (desplazamiento, mascara) in zip(cubo.dimensiones, cubo.empaquetado(bits))]
+
+        def decodificar(clave):
+            return tuple((clave >> d) & m if texto is None else texto((clave >> d) & m) for d, m, texto in partes)
+        return decodificar
+
+    agregados = {cubo.nombre: VistaAgregado(bocetos[cubo.nombre] if cubo.distintos else contadores[cubo.nombre],
+                                            decodificador(cubo))
+                 for cubo in CUBOS}
+    return agregados, directorio
+
+def limpiar_agregados(directorio):
+    """Borra los volcados temporales de agregar_con_memoria_acotada()."""
+    for nombre in os.listdir(directorio):
+        os.remove(os.path.join(directorio, nombre))
+    os.rmdir(directorio)
@@ -0,0 +1,99 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cubos_olap import CUBOS, CUBOS_CONTEO, CUBOS_DISTINTOS, valores_escucha
+
+# Fragmentos por proceso: más fragmentos que procesos reparten mejor la carga
+FRAGMENTOS_POR_PROCESO = 4
+
+# Dimensiones de cada proceso trabajador (se envían una sola vez al iniciarlo)
+_usuarios = {}
+_canciones = {}
+
+def calcular_fragmentos(archivo, cantidad):
+    """
+    Divide archivo en rangos de bytes [inicio, fin) alineados a inicios de
+    línea, saltando el encabezado.
+    """
+    tamano = os.path.getsize(archivo)
+    with open(archivo, 'rb') as f:
+        inicio_datos = len(f.readline())
+        limites = [inicio_datos]
+        paso = max(1, (tamano - inicio_datos) // cantidad)
+        for i in range(1, cantidad):
+            posicion = inicio_datos + i * paso
+            if posicion >= tamano:
+                break
+            # Avanzar hasta el comienzo de la siguiente línea
+            f.seek(posicion - 1)
+            f.readline()
+            limite = f.tell()
+            if limite > limites[-1] and limite < tamano:
+                limites.append(limite)
+        limites.append(tamano)
+    return [(limites[i], limites[i + 1]) for i in range(len(limites) - 1)]
+
+def _iniciar_proceso(usuarios, canciones):
+    global _usuarios, _canciones
+    _usuarios = usuarios
+    _canciones = canciones
+
+def _agregar_fragmento(archivo, columnas, inicio, fin):
+    """Agrega las escuchas de un rango de bytes del archivo."""
+    i_usuario = columnas.index('usuario_id')
+    i_cancion = columnas.index('cancion_id')
+    i_fecha = columnas.index('fecha_escucha')
+    desconocida = {'artista': 'desconocido', 'genero': 'desconocido'}
+    parciales = {cubo.nombre: cubo.contador() for cubo in CUBOS}
+
+    with open(archivo, 'rb') as f:
+        f.seek(inicio)
+        posicion = inicio
+        while posicion < fin:
+            linea = f.readline()
+            if not linea:
+                break
+            posicion += len(linea)
+            texto = linea.decode('utf-8').strip()
+            if not texto:
+                continue
+            row = next(csv.reader([texto]))
+            user_id = int(row[i_usuario])
+            song_id = int(row[i_cancion])
+            cancion_info = _canciones.get(song_id, desconocida)
+            valores = valores_escucha(user_id, song_id, row[i_fecha], _usuarios.get(user_id, 'desconocido'),
+                                      cancion_info['artista'], cancion_info['genero'])
+            for cubo in CUBOS_CONTEO:
+                parciales[cubo.nombre][cubo.clave(valores)] += 1
+            for cubo in CUBOS_DISTINTOS:
+                parciales[cubo.nombre][cubo.clave(valores)].agregar(user_id)
+
+    return {nombre: dict(conteos) for nombre, conteos in parciales.items()}
+
+def agregar_en_paralelo(archivo, usuarios, canciones, procesos=None):
+    """
+    Calcula los agregados OLAP repartiendo archivo en fragmentos por
+    rangos de bytes, cada uno agregado en un proceso distinto. Los conteos
+    parciales se suman (y los bocetos de oyentes se unen) a medida que
+    terminan los fragmentos.
+    Devuelve un diccionario con la misma forma que nuevos_agregados().
+    """
+    procesos = procesos or os.cpu_count() or 1
+    with open(archivo, encoding='utf-8') as f:
+        columnas = next(csv.reader([f.readline()]))
+    fragmentos = calcular_fragmentos(archivo, procesos * FRAGMENTOS_POR_PROCESO)
+
+    totales = {cubo.nombre: cubo.contador() for cubo in CUBOS}
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                             initargs=(usuarios, canciones)) as pool:
+        futuros = [pool.submit(_agregar_fragmento, archivo, columnas, inicio, fin)
+                   for inicio, fin in fragmentos]
+        for futuro in as_completed(futuros):
+            parcial = futuro.result()
+            for cubo in CUBOS:
+                cubo.sumar(totales[cubo.nombre], parcial[cubo.nombre])
+
+    print(f"⚙️ Agregación paralela: {len(fragmentos)} fragmentos en {procesos} procesos")
+    return totales
@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+from cassandra.query import BatchStatement, SimpleStatement
+
+import cargar_datos_cassandra as carga
+from generar_datos import generar_dataset
+
+MODOS_AGREGACION = ('dict', 'memoria', 'procesos', 'columnar', 'cache')
+
+# Sesión de Cassandra simulada
+class _FuturoGrabado:
+    """Respuesta inmediata con la interfaz mínima de ResponseFuture."""
+
+    _col_names = None
+    _col_types = None
+    has_more_pages = False
+
+    def __init__(self, sesion):
+        self._sesion = sesion
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        # Como el driver real, las respuestas llegan desde otro hilo
+        self._sesion.submit(callback, [], *callback_args, **(callback_kwargs or {}))
+
+    def clear_callbacks(self):
+        pass
+
+    def result(self):
+        return []
+
+class SesionGrabadora:
+    """
+    Sustituto local de la sesión de Cassandra: no envía nada por la red y
+    solo cuenta sentencias y filas escritas por tabla.
+    """
+
+    def __init__(self):
+        self.sentencias = Counter()
+        self.filas = Counter()
+        self._lock = threading.Lock()
+        self._callbacks = ThreadPoolExecutor(max_workers=1)
+
+    def prepare(self, query):
+        # Las sentencias "preparadas" se guardan como SimpleStatement con %s
+        return SimpleStatement(query.replace('?', '%s'))
+
+    def _grabar(self, query):
+        if isinstance(query, BatchStatement):
+            tablas = [self._tabla(s) for _, s, _ in query._statements_and_parameters]
+        else:
+            tablas = [self._tabla(query)]
+        with self._lock:
+            self.sentencias[tablas[0] if tablas else 'batch'] += 1
+            for tabla in tablas:
+                self.filas[tabla] += 1
+
+    @staticmethod
+    def _tabla(query):
+        texto = getattr(query, 'query_string', query)
+        m = re.search(r"(?:INTO|FROM|UPDATE)\s+(\w+)", texto, re.I)
+        return m.group(1) if m else texto
+
+    def execute(self, query, parameters=None, **kwargs):
+        self._grabar(query)
+        return []
+
+    def execute_async(self, query, parameters=None, **kwargs):
+        self._grabar(query)
+        return _FuturoGrabado(self)
+
+    def submit(self, funcion, *args, **kwargs):
+        return self._callbacks.submit(funcion, *args, **kwargs)
+
+    def cerrar(self):
+        self._callbacks.shutdown()
+
+# Medición de etapas
+INTERVALO_MUESTREO = 0.01      # Segundos entre lecturas del RSS durante una etapa
+
+def _rss_proc(pid):
+    """RSS en bytes de pid y sus descendientes, leído de /proc (Linux)."""
+    with open(f'/proc/{pid}/statm') as f:
+        total = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            hijos = f.read().split()
+    except OSError:
+        hijos = []
+    for hijo in hijos:
+        try:
+            total += _rss_proc(hijo)
+        except OSError:     # El hijo terminó entre lecturas
+            pass
+    return total
+
+def _rss_psutil():
+    import psutil
+    proceso = psutil.Process()
+    total = proceso.memory_info().rss
+    for hijo in proceso.children(recursive=True):
+        try:
+            total += hijo.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+def _lector_rss():
+    """
+    Función que devuelve el RSS actual en bytes (proceso y procesos hijos),
+    o None si la plataforma no permite leerlo: /proc en Linux y, si está
+    instalado, psutil en el resto.
+    """
+    for lector in (lambda: _rss_proc(os.getpid()), _rss_psutil):
+        try:
+            lector()
+            return lector
+        except (OSError, ImportError):
+            pass
+    return None
+
+_leer_rss = _lector_rss()
+
+def _rss_maximo_proceso_mb():
+    """Pico de RSS de toda la vida del proceso (sin lector de RSS actual)."""
+    if resource is None:
+        return None
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    unidad = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return max(propio, hijos) / unidad
+
+class _PicoRSS:
+    """Muestrea el RSS en un hilo mientras dura una etapa y guarda el máximo."""
+
+    def __enter__(self):
+        self.inicio = self.maximo = _leer_rss() if _leer_rss else None
+        self._fin = threading.Event()
+        if _leer_rss is not None:
+            self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+            self._hilo.start()
+        return self
+
+    def _muestrear(self):
+        while not self._fin.wait(INTERVALO_MUESTREO):
+            self.maximo = max(self.maximo, _leer_rss())
+
+    def __exit__(self, *error):
+        self._fin.set()
+        if _leer_rss is not None:
+            self._hilo.join()
+            self.maximo = max(self.maximo, _leer_rss())
+
+    def medicion_mb(self):
+        """(RSS máximo durante la etapa, aumento sobre el inicio), en MB."""
+        if self.maximo is None:
+            return _rss_maximo_proceso_mb(), None
+        return self.maximo / 2 ** 20, (self.maximo - self.inicio) / 2 ** 20
+
+def medir(resultados, etapa, funcion, filas=None):
+    """Ejecuta funcion, imprime su duración y memoria y guarda la medición."""
+    with _PicoRSS() as pico:
+        inicio = time.perf_counter()
+        valor = funcion()
+        duracion = time.perf_counter() - inicio
+    if filas is None:
+        filas = valor if isinstance(valor, int) else 0
+    velocidad = filas / duracion if duracion > 0 else 0
+    rss, aumento = pico.medicion_mb()
+    resultados.append({'etapa': etapa, 'segundos': round(duracion, 3), 'filas': filas,
+                       'filas_por_segundo': round(velocidad),
+                       'rss_maximo_mb': None if rss is None else round(rss, 1),
+                       'rss_aumento_mb': None if aumento is None else round(aumento, 1)})
+    memoria = "RSS máx n/d" if rss is None else f"RSS máx {rss:,.0f} MB"
+    if aumento is not None:
+        memoria += f" (+{aumento:,.0f} MB)"
+    print(f"⏱️ {etapa:<32} {duracion:8.2f} s  {filas:>12,} filas  {velocidad:>12,.0f} filas/s  {memoria}")
+    return valor
+
+def limpiar_cache():
+    """Borra la cache columnar de los CSV actuales para medir su creación."""
+    from cache_columnar import ruta_cache
+    for archivo in (carga.ARCHIVO_ESCUCHAS, carga.ARCHIVO_USUARIOS):
+        shutil.rmtree(ruta_cache(archivo), ignore_errors=True)
+
+def _contar(filas):
+    return sum(1 for _ in filas)
+
+def ejecutar_benchmark(directorio, modos=MODOS_AGREGACION, masivo=True, en_vuelo=carga.EN_VUELO_POR_DEFECTO,
+                       memoria_mb=256, procesos=None):
+    """Mide cada etapa del cargador sobre los CSV de directorio."""
+    carga.ARCHIVO_USUARIOS = os.path.join(directorio, 'usuarios.csv')
+    carga.ARCHIVO_CANCIONES = os.path.join(directorio, 'canciones.csv')
+    carga.ARCHIVO_ESCUCHAS = os.path.join(directorio, 'escuchas.csv')
+    opciones = dict(masivo=masivo, en_vuelo=en_vuelo)
+    resultados = []
+
+    total_escuchas = medir(resultados, "parseo CSV escuchas", lambda: _contar(carga.leer_escuchas()))
+
+    sesion = SesionGrabadora()
+    try:
+        medir(resultados, "inserts usuarios", lambda: carga.cargar_usuarios(sesion, **opciones),
+              filas=_contar(carga.leer_usuarios()))
+        medir(resultados, "inserts canciones", lambda: carga.cargar_canciones(sesion, **opciones),
+              filas=_contar(carga.leer_canciones()))
+        medir(resultados, "inserts escuchas", lambda: carga.cargar_escuchas(sesion, **opciones),
+              filas=total_escuchas)
+
+        for modo in modos:
+            parametros = {
+                'dict': {},
+                'memoria': {'memoria_mb': memoria_mb},
+                'procesos': {'procesos': procesos or 0},
+                'columnar': {'columnar': True},
+                'cache': {'cache': True},
+            }[modo]
+            if modo == 'cache':
+                # La primera pasada crea la cache; la medida es la reutilización
+                limpiar_cache()
+                medir(resultados, "creación de cache", lambda: carga.calcular_agregados(**parametros),
+                      filas=total_escuchas)
+            agregados, liberar = medir(
+                resultados, f"agregación ({modo})",
+                lambda: carga.calcular_agregados(**parametros),
+                filas=total_escuchas)
+
+            def escribir():
+                antes = sum(sesion.filas.values())
+                carga.escribir_tablas_olap(sesion, agregados, **opciones)
+                return sum(sesion.filas.values()) - antes
+
+            try:
+                medir(resultados, f"inserts OLAP ({modo})", escribir)
+            finally:
+                liberar()
+    finally:
+        sesion.cerrar()
+    return resultados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento del cargador de datos.")
+    parser.add_argument("--datos", help="Directorio con usuarios.csv, canciones.csv y escuchas.csv "
+                                        "(por defecto se generan datos sintéticos)")
+    parser.add_argument("--escuchas", type=int, default=1000000, help="Escuchas sintéticas a generar")
+    parser.add_argument("--usuarios", type=int, default=100000)
+    parser.add_argument("--canciones", type=int, default=50000)
+    parser.add_argument("--modos", default=",".join(MODOS_AGREGACION),
+                        help=f"Modos de agregación a medir ({', '.join(MODOS_AGREGACION)})")
+    parser.add_argument("--sin-masivo", action="store_true", help="Mide los inserts fila a fila")
+    parser.add_argument("--en-vuelo", type=int, default=carga.EN_VUELO_POR_DEFECTO)
+    parser.add_argument("--memoria-mb", type=int, default=256)
+    parser.add_argument("--procesos", type=int)
+    parser.add_argument("--salida", help="Guarda los resultados en este archivo JSON")
+    args = parser.parse_args(argv)
+
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+    for modo in modos:
+        if modo not in MODOS_AGREGACION:
+            parser.error(f"modo desconocido: {modo}")
+
+    temporal = None
+    directorio = args.datos
+    if directorio is None:
+        temporal = tempfile.TemporaryDirectory(prefix='bench_spotify_')
+        directorio = temporal.name
+        print(f"Generando {args.escuchas:,} escuchas sintéticas en {directorio}...")
+        generar_dataset(directorio, usuarios=args.usuarios, canciones=args.canciones, escuchas=args.escuchas)
+
+    try:
+        resultados = ejecutar_benchmark(directorio, modos=modos, masivo=not args.sin_masivo,
+                                        en_vuelo=args.en_vuelo, memoria_mb=args.memoria_mb,
+                                        procesos=args.procesos)
+    finally:
+        if temporal is not None:
+            temporal.cleanup()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.salida}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from agregacion_columnar import (DimensionesCodificadas, agregar_bloques, codificar_dimensiones,
+                                 leer_bloques_escuchas)
+
+# Filas entregadas por bloque al recorrer las columnas mapeadas en memoria
+FILAS_POR_BLOQUE = 4 * 1024 * 1024
+VERSION_CACHE = 1
+
+# Columnas de escuchas: nombre -> archivo int32
+COLUMNAS_ESCUCHAS = {
+    'usuario_id': 'usuario_id.i32',
+    'cancion_id': 'cancion_id.i32',
+    'fecha': 'fecha.i32',
+}
+# Dimensiones codificadas (códigos indexados por id): nombre -> archivo int32
+COLUMNAS_DIMENSIONES = {
+    'ciudad_por_usuario': 'ciudad_por_usuario.i32',
+    'artista_por_cancion': 'artista_por_cancion.i32',
+    'genero_por_cancion': 'genero_por_cancion.i32',
+}
+LIMITE_INT32 = 2 ** 31 - 1
+
+def ruta_cache(archivo):
+    """Directorio de la cache binaria, junto al CSV de origen."""
+    return archivo + '.cache'
+
+def _firma(archivo):
+    info = os.stat(archivo)
+    return {'tamano': info.st_size, 'mtime': info.st_mtime}
+
+def _leer_meta(directorio):
+    try:
+        with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _escribir_meta(directorio, meta):
+    temporal = os.path.join(directorio, 'meta.json.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temporal, os.path.join(directorio, 'meta.json'))
+
+def _mapear(directorio, nombre, filas):
+    """Mapea en memoria una columna int32 sin copiarla."""
+    if filas == 0:
+        return np.zeros(0, dtype=np.int32)
+    return np.memmap(os.path.join(directorio, nombre), dtype=np.int32, mode='r', shape=(filas,))
+
+def _a_int32(valores, columna):
+    if len(valores) and (valores.min() < 0 or valores.max() > LIMITE_INT32):
+        raise ValueError(f"{columna}: valores fuera del rango de int32")
+    return valores.astype(np.int32)
+
+def construir_cache_escuchas(archivo, directorio):
+    """Parsea archivo una vez y guarda sus columnas como binarios int32."""
+    temporal = directorio + '.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    firma = _firma(archivo)
+
+    archivos = {columna: open(os.path.join(temporal, nombre), 'wb')
+                for columna, nombre in COLUMNAS_ESCUCHAS.items()}
+    filas = 0
+    try:
+        for user_ids, song_ids, fechas in leer_bloques_escuchas(archivo):
+            _a_int32(user_ids, 'usuario_id').tofile(archivos['usuario_id'])
+            _a_int32(song_ids, 'cancion_id').tofile(archivos['cancion_id'])
+            _a_int32(fechas, 'fecha').tofile(archivos['fecha'])
+            filas += len(user_ids)
+    finally:
+        for f in archivos.values():
+            f.close()
+
+    _escribir_meta(temporal, {'version': VERSION_CACHE, 'origen': firma, 'filas': filas})
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.replace(temporal, directorio)
+    print(f"💾 Cache columnar creada: {filas} escuchas en {directorio}")
+
+def abrir_escuchas(archivo):
+    """
+    Devuelve las columnas (usuario, canción, fecha AAAAMMDD) de archivo
+    mapeadas en memoria, reconstruyendo la cache si el CSV cambió de
+    tamaño o fecha de modificación.
+    """
+    directorio = ruta_cache(archivo)
+    meta = _leer_meta(directorio)
+    if (meta is None or meta.get('version') != VERSION_CACHE
+            or meta.get('origen') != _firma(archivo)):
+        construir_cache_escuchas(archivo, directorio)
+        meta = _leer_meta(directorio)
+
+    filas = meta['filas']
+    return tuple(_mapear(directorio, nombre, filas) for nombre in COLUMNAS_ESCUCHAS.values())
+
+def abrir_dimensiones(archivo_usuarios, archivo_canciones, cargar_dimensiones):
+    """
+    Devuelve las DimensionesCodificadas guardadas junto a archivo_usuarios.
+    Si alguno de los dos CSV cambió, las reconstruye con cargar_dimensiones().
+    """
+    directorio = ruta_cache(archivo_usuarios)
+    firmas = {'usuarios': _firma(archivo_usuarios), 'canciones': _firma(archivo_canciones)}
+    meta = _leer_meta(directorio)
+
+    if meta is None or meta.get('version') != VERSION_CACHE or meta.get('origen') != firmas:
+        temporal = directorio + '.tmp'
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        dimensiones = codificar_dimensiones(*cargar_dimensiones())
+        largos = {}
+        for columna, nombre in COLUMNAS_DIMENSIONES.items():
+            valores = _a_int32(getattr(dimensiones, columna), columna)
+            valores.tofile(os.path.join(temporal, nombre))
+            largos[columna] = len(valores)
+        _escribir_meta(temporal, {
+            'version': VERSION_CACHE, 'origen': firmas, 'largos': largos,
+            'ciudades': dimensiones.ciudades, 'artistas': dimensiones.artistas, 'generos': dimensiones.generos,
+        })
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.replace(temporal, directorio)
+        meta = _leer_meta(directorio)
+
+    columnas = {columna: _mapear(directorio, nombre, meta['largos'][columna])
+                for columna, nombre in COLUMNAS_DIMENSIONES.items()}
+    return DimensionesCodificadas(columnas['ciudad_por_usuario'], meta['ciudades'],
+                                  columnas['artista_por_cancion'], meta['artistas'],
+                                  columnas['genero_por_cancion'], meta['generos'])
+
+def _bloques(columnas, filas_por_bloque=FILAS_POR_BLOQUE):
+    user_ids, song_ids, fechas = columnas
+    for inicio in range(0, len(user_ids), filas_por_bloque):
+        fin = inicio + filas_por_bloque
+        yield user_ids[inicio:fin], song_ids[inicio:fin], fechas[inicio:fin]
+
+def agregar_desde_cache(archivo_escuchas, archivo_usuarios, archivo_canciones, cargar_dimensiones):
+    """
+    Calcula los agregados OLAP desde la cache binaria de escuchas y de
+    dimensiones, creándola o renovándola si sus CSV de origen cambiaron.
+    """
+    columnas = abrir_escuchas(archivo_escuchas)
+    dimensiones = abrir_dimensiones(archivo_usuarios, archivo_canciones, cargar_dimensiones)
+    return agregar_bloques(_bloques(columnas), dimensiones)
@@ -1,16 +1,31 @@
+import argparse
 import csv
+import json
+import os
+import pickle
+import queue
+import threading
 from cassandra.cluster import Cluster
-from cassandra.query import SimpleStatement
-from collections import defaultdict
-from datetime import datetime
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import SimpleStatement, BatchStatement, BatchType
+from collections import defaultdict, deque
 import time
 
+from cubos_olap import CUBOS, CUBOS_CONTEO, CUBOS_DISTINTOS, valores_escucha
+from hyperloglog import HyperLogLog
+
 # Configuración
 KEYSPACE = 'spotify_test'
 CASSANDRA_HOSTS = ['127.0.0.1']
 ARCHIVO_USUARIOS = 'usuarios.csv'
 ARCHIVO_CANCIONES = 'canciones.csv'
 ARCHIVO_ESCUCHAS = 'escuchas.csv'
+MARCA_OLAP = 'olap'            # Marca de la última reconstrucción de las tablas OLAP
+
+# Configuración de la carga masiva
+EN_VUELO_POR_DEFECTO = 128     # Máximo de escrituras simultáneas
+FILAS_POR_BATCH = 50           # Filas por batch UNLOGGED (misma partición)
+MAX_FILAS_EN_BUFFER = 5000     # Filas retenidas antes de vaciar los batches
 
 # Conexión y creación del keyspace si no existe
 def conectar_cassandra():
@@ -52,139 +67,821 @@ def crear_tablas(session):
                 PRIMARY KEY (usuario_id, fecha_escucha, cancion_id)
             );
         """,
-        "tendencia_por_dia": """
-            CREATE TABLE IF NOT EXISTS tendencia_por_dia (
-                fecha text PRIMARY KEY,
-                total_reproducciones int
-            );
-        """,
-        "top_canciones_por_usuario": """
-            CREATE TABLE IF NOT EXISTS top_canciones_por_usuario (
-                id_usuario int,
-                total_reproducciones int,
-                id_cancion int,
-                PRIMARY KEY (id_usuario, total_reproducciones, id_cancion)
-            ) WITH CLUSTERING ORDER BY (total_reproducciones DESC, id_cancion ASC);
-        """,
-        "reproducciones_por_artista_mes": """
-            CREATE TABLE IF NOT EXISTS reproducciones_por_artista_mes (
-                artista text,
-                mes text,
-                reproducciones int,
-                PRIMARY KEY (artista, mes)
-            );
-        """,
-        "reproducciones_por_ciudad_genero": """
-            CREATE TABLE IF NOT EXISTS reproducciones_por_ciudad_genero (
-                ciudad text,
-                genero text,
-                reproducciones int,
-                PRIMARY KEY (ciudad, genero)
-            );
-        """,
-        "reproducciones_por_genero_mes": """
-            CREATE TABLE IF NOT EXISTS reproducciones_por_genero_mes (
-                genero text,
-                mes text,
-                reproducciones int,
-                PRIMARY KEY (genero, mes)
+        "marcas_carga": """
+            CREATE TABLE IF NOT EXISTS marcas_carga (
+                archivo text PRIMARY KEY,
+                posicion bigint,
+                filas bigint,
+                actualizado timestamp
             );
         """
     }
+    # Tablas OLAP generadas desde el registro de cubos
+    tablas.update((cubo.tabla, cubo.crear_tabla()) for cubo in CUBOS)
 
     for nombre, query in tablas.items():
         session.execute(query)
     print("✅ Todas las tablas creadas.")
 
-# Carga de datos base
-def cargar_usuarios(session):
+# Carga masiva con sentencias preparadas y concurrencia acotada
+def _agrupar_en_batches(stmt, filas, clave_particion, filas_por_batch=FILAS_POR_BATCH):
+    """
+    Agrupa filas de la misma partición en batches UNLOGGED.
+    Devuelve pares (sentencia, parámetros) listos para execute_concurrent.
+    """
+    buffer = defaultdict(list)
+    en_buffer = 0
+
+    def crear_batch(grupo):
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+        for valores in grupo:
+            batch.add(stmt, valores)
+        return batch, None
+
+    for valores in filas:
+        clave = clave_particion(valores)
+        grupo = buffer[clave]
+        grupo.append(valores)
+        en_buffer += 1
+        if len(grupo) >= filas_por_batch:
+            yield crear_batch(grupo)
+            en_buffer -= len(grupo)
+            del buffer[clave]
+        elif en_buffer >= MAX_FILAS_EN_BUFFER:
+            # Vaciar todo para acotar la memoria usada por el buffer
+            for grupo_pendiente in buffer.values():
+                yield crear_batch(grupo_pendiente)
+            buffer.clear()
+            en_buffer = 0
+
+    for grupo_pendiente in buffer.values():
+        yield crear_batch(grupo_pendiente)
+
+def cargar_filas_masivo(session, tabla, query, filas, clave_particion=None,
+                        en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False, al_confirmar=None,
+                        estricto=False):
+    """
+    Inserta filas preparando la sentencia una sola vez y enviándolas
+    con un número acotado de escrituras en vuelo.
+    Si usar_batches es True y hay clave_particion, agrupa las filas de la
+    misma partición en batches UNLOGGED.
+    Con estricto, la primera escritura fallida lanza su excepción en lugar
+    de solo contarse.
+    Con al_confirmar (que implica estricto), filas entrega pares
+    (valores, marca) y se llama a al_confirmar(marca) cuando esa fila y
+    todas las anteriores están escritas.
+    Devuelve la cantidad de filas escritas.
+    """
+    if al_confirmar is not None and usar_batches:
+        raise ValueError("al_confirmar no admite batches: las filas se reagrupan fuera de orden")
+    stmt = session.prepare(query)
+    total = 0
+    marcas = deque()
+
+    def contar(filas_iter):
+        nonlocal total
+        for valores in filas_iter:
+            total += 1
+            if al_confirmar is not None:
+                valores, marca = valores
+                marcas.append(marca)
+            yield valores
+
+    filas = contar(filas)
+    if usar_batches and clave_particion is not None:
+        sentencias = _agrupar_en_batches(stmt, filas, clave_particion)
+    else:
+        sentencias = ((stmt, valores) for valores in filas)
+
+    inicio = time.time()
+    errores = 0
+    resultados = execute_concurrent(
+        session, sentencias,
+        concurrency=en_vuelo,
+        raise_on_first_error=False,
+        results_generator=True
+    )
+    for success, result in resultados:
+        if not success and (estricto or al_confirmar is not None):
+            raise result
+        if al_confirmar is not None:
+            # Los resultados llegan en el orden de envío
+            al_confirmar(marcas.popleft())
+        elif not success:
+            errores += 1
+            if errores <= 10:
+                print(f"Error al insertar en {tabla}: {result}")
+
+    duracion = time.time() - inicio
+    velocidad = total / duracion if duracion > 0 else 0
+    print(f"📊 {tabla}: {total} filas en {duracion:.2f} s ({velocidad:,.0f} filas/s)")
+    if errores:
+        print(f"⚠️ {tabla}: {errores} escrituras fallidas")
+    return total
+
+# Lectores de filas base
+def _valores_usuario(row):
+    return (int(row['usuario_id']), row['nombre'], row['ciudad'])
+
+def _valores_cancion(row):
+    return (int(row['cancion_id']), row['titulo'], row['artista'], row['genero'])
+
+def _valores_escucha(row):
+    return (int(row['usuario_id']), row['fecha_escucha'], int(row['cancion_id']))
+
+def leer_usuarios():
     with open(ARCHIVO_USUARIOS, newline='', encoding='utf-8') as f:
         for row in csv.DictReader(f):
-            session.execute(
-                "INSERT INTO usuarios (usuario_id, nombre, ciudad) VALUES (%s, %s, %s)",
-                (int(row['usuario_id']), row['nombre'], row['ciudad'])
-            )
-    print("✅ Usuarios cargados.")
+            yield _valores_usuario(row)
 
-def cargar_canciones(session):
+def leer_canciones():
     with open(ARCHIVO_CANCIONES, newline='', encoding='utf-8') as f:
         for row in csv.DictReader(f):
-            session.execute(
-                "INSERT INTO canciones (cancion_id, titulo, artista, genero) VALUES (%s, %s, %s, %s)",
-                (int(row['cancion_id']), row['titulo'], row['artista'], row['genero'])
-            )
-    print("✅ Canciones cargadas.")
+            yield _valores_cancion(row)
 
-def cargar_escuchas(session):
+def leer_escuchas():
     with open(ARCHIVO_ESCUCHAS, newline='', encoding='utf-8') as f:
         for row in csv.DictReader(f):
-            session.execute(
-                "INSERT INTO escuchas (usuario_id, fecha_escucha, cancion_id) VALUES (%s, %s, %s)",
-                (int(row['usuario_id']), row['fecha_escucha'], int(row['cancion_id']))
-            )
+            yield _valores_escucha(row)
+
+def leer_csv_desde(archivo, offset=0, solo_completas=False):
+    """
+    Lee un CSV a partir del byte offset (0 = inicio de los datos) y entrega
+    pares (fila como dict, posición en bytes al final de la fila).
+    Con solo_completas, una última línea sin salto de línea se deja para la
+    próxima pasada (el archivo puede estar escribiéndose); si no, es una fila.
+    """
+    with open(archivo, 'rb') as f:
+        encabezado = f.readline()
+        columnas = next(csv.reader([encabezado.decode('utf-8')]))
+        posicion = max(offset, len(encabezado))
+        f.seek(posicion)
+        for linea in f:
+            if solo_completas and not linea.endswith(b'\n'):
+                # Línea a medio escribir: se leerá en la próxima pasada
+                break
+            posicion += len(linea)
+            texto = linea.decode('utf-8').strip()
+            if not texto:
+                continue
+            yield dict(zip(columnas, next(csv.reader([texto])))), posicion
+
+INSERT_USUARIOS = "INSERT INTO usuarios (usuario_id, nombre, ciudad) VALUES (%s, %s, %s)"
+INSERT_CANCIONES = "INSERT INTO canciones (cancion_id, titulo, artista, genero) VALUES (%s, %s, %s, %s)"
+INSERT_ESCUCHAS = "INSERT INTO escuchas (usuario_id, fecha_escucha, cancion_id) VALUES (%s, %s, %s)"
+
+def _preparada(query):
+    """Convierte una consulta con %s al formato de sentencia preparada."""
+    return query.replace("%s", "?")
+
+# Carga de datos base
+def cargar_usuarios(session, masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False):
+    if masivo:
+        cargar_filas_masivo(session, "usuarios", _preparada(INSERT_USUARIOS), leer_usuarios(),
+                            clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    else:
+        for valores in leer_usuarios():
+            session.execute(INSERT_USUARIOS, valores)
+    print("✅ Usuarios cargados.")
+
+def cargar_canciones(session, masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False):
+    if masivo:
+        cargar_filas_masivo(session, "canciones", _preparada(INSERT_CANCIONES), leer_canciones(),
+                            clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    else:
+        for valores in leer_canciones():
+            session.execute(INSERT_CANCIONES, valores)
+    print("✅ Canciones cargadas.")
+
+def cargar_escuchas(session, masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False):
+    if masivo:
+        # Partición de escuchas: usuario_id
+        cargar_filas_masivo(session, "escuchas", _preparada(INSERT_ESCUCHAS), leer_escuchas(),
+                            clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    else:
+        for valores in leer_escuchas():
+            session.execute(INSERT_ESCUCHAS, valores)
     print("✅ Escuchas cargadas.")
 
+CANCION_DESCONOCIDA = {'artista': 'desconocido', 'genero': 'desconocido'}
+
+# Dimensiones y agregados OLAP
+def cargar_dimensiones():
+    """Lee usuarios y canciones y devuelve los mapas de dimensiones."""
+    usuarios = {}
+    for usuario_id, _, ciudad in leer_usuarios():
+        usuarios[usuario_id] = ciudad
+
+    canciones = {}
+    for cancion_id, _, artista, genero in leer_canciones():
+        canciones[cancion_id] = {'artista': artista, 'genero': genero}
+    return usuarios, canciones
+
+def nuevos_agregados():
+    """Crea los agregados OLAP vacíos (uno por cubo del registro)."""
+    return {cubo.nombre: cubo.contador() for cubo in CUBOS}
+
+def acumular_escucha(agregados, usuarios, canciones, user_id, fecha, song_id):
+    """Suma una escucha a todos los agregados OLAP (y su usuario a los bocetos de oyentes)."""
+    cancion_info = canciones.get(song_id, CANCION_DESCONOCIDA)
+    valores = valores_escucha(user_id, song_id, fecha, usuarios.get(user_id, 'desconocido'),
+                              cancion_info['artista'], cancion_info['genero'])
+    for cubo in CUBOS_CONTEO:
+        agregados[cubo.nombre][cubo.clave(valores)] += 1
+    for cubo in CUBOS_DISTINTOS:
+        agregados[cubo.nombre][cubo.clave(valores)].agregar(user_id)
+
+def sumar_agregados(destino, origen):
+    """Suma en destino los conteos (y une los bocetos) de otro conjunto de agregados."""
+    for cubo in CUBOS:
+        cubo.sumar(destino[cubo.nombre], origen[cubo.nombre])
+
+def filas_olap(agregados):
+    """
+    Devuelve, por cubo, un generador con sus filas (clave + conteo, o el
+    boceto serializado) en el orden de columnas de cubo.insert().
+    """
+    def filas(cubo):
+        if cubo.distintos:
+            return (clave + (bytes(boceto),) for clave, boceto in agregados[cubo.nombre].items())
+        return (clave + (conteo,) for clave, conteo in agregados[cubo.nombre].items())
+    return [(cubo, filas(cubo)) for cubo in CUBOS]
+
+def escribir_tablas_olap(session, agregados, masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False,
+                         omitir=(), al_completar=None):
+    """
+    Escribe los agregados en las tablas OLAP de sus cubos.
+    Las tablas en omitir se saltan y al_completar(tabla) se llama al
+    terminar cada una; en ese caso cualquier escritura fallida se propaga.
+    """
+    for cubo, filas in filas_olap(agregados):
+        tabla, query = cubo.tabla, cubo.insert()
+        if tabla in omitir:
+            print(f"⏭️ {tabla}: ya completa")
+            continue
+        if masivo:
+            # Las primeras columnas de cada tabla OLAP forman su clave de partición
+            cargar_filas_masivo(session, tabla, _preparada(query), filas,
+                                clave_particion=lambda v, n=len(cubo.particion): v[:n], en_vuelo=en_vuelo, usar_batches=usar_batches,
+                                estricto=al_completar is not None)
+        else:
+            for valores in filas:
+                session.execute(query, valores)
+        if al_completar is not None:
+            al_completar(tabla)
+
 # Procesar OLAP
-def cargar_tablas_olap(session):
+def _sin_recursos():
+    pass
+
+def calcular_agregados(memoria_mb=None, procesos=None, columnar=False, cache=False):
+    """
+    Calcula los agregados OLAP de escuchas.csv.
+    Con memoria_mb, la agregación usa claves enteras compactas y vuelca
+    ejecuciones ordenadas a disco al superar ese presupuesto.
+    Con procesos, el archivo se reparte por rangos de bytes entre varios
+    procesos y sus conteos parciales se suman antes de escribir.
+    Con columnar, las escuchas se leen por bloques en arrays de enteros y
+    los conteos se calculan con operaciones vectorizadas de numpy.
+    Con cache, la agregación columnar lee una cache binaria de escuchas y
+    dimensiones mapeada en memoria, que se reconstruye si los CSV cambian.
+    Devuelve los agregados y una función que libera sus archivos temporales.
+    """
+    if cache:
+        from cache_columnar import agregar_desde_cache
+        agregados = agregar_desde_cache(ARCHIVO_ESCUCHAS, ARCHIVO_USUARIOS, ARCHIVO_CANCIONES, cargar_dimensiones)
+        return agregados, _sin_recursos
+
+    usuarios, canciones = cargar_dimensiones()
+    if columnar:
+        from agregacion_columnar import agregar_columnar
+        return agregar_columnar(ARCHIVO_ESCUCHAS, usuarios, canciones), _sin_recursos
+    if procesos is not None:
+        from agregacion_paralela import agregar_en_paralelo
+        return agregar_en_paralelo(ARCHIVO_ESCUCHAS, usuarios, canciones, procesos), _sin_recursos
+    if memoria_mb:
+        from agregacion_externa import agregar_con_memoria_acotada, limpiar_agregados
+        agregados, directorio = agregar_con_memoria_acotada(leer_escuchas(), usuarios, canciones, memoria_mb)
+        return agregados, lambda: limpiar_agregados(directorio)
+
+    agregados = nuevos_agregados()
+    for user_id, fecha, song_id in leer_escuchas():
+        acumular_escucha(agregados, usuarios, canciones, user_id, fecha, song_id)
+    return agregados, _sin_recursos
+
+def cargar_tablas_olap(session, masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False,
+                       memoria_mb=None, procesos=None, columnar=False, cache=False):
+    """Calcula y escribe los agregados OLAP a partir de escuchas.csv."""
+    agregados, liberar = calcular_agregados(memoria_mb=memoria_mb, procesos=procesos,
+                                            columnar=columnar, cache=cache)
+    try:
+        escribir_tablas_olap(session, agregados, masivo=masivo, en_vuelo=en_vuelo, usar_batches=usar_batches)
+    finally:
+        liberar()
+    print("✅ Tablas OLAP cargadas.")
+
+# Reconstrucción OLAP desde Cassandra
+def cargar_dimensiones_cassandra(session):
+    """Lee las dimensiones de usuarios y canciones directamente de Cassandra."""
+    from escaneo_cassandra import leer_tabla
+
     usuarios = {}
-    with open(ARCHIVO_USUARIOS, encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            usuarios[int(row['usuario_id'])] = row['ciudad']
+    for row in leer_tabla(session, "SELECT usuario_id, ciudad FROM usuarios"):
+        usuarios[row.usuario_id] = row.ciudad
 
     canciones = {}
-    with open(ARCHIVO_CANCIONES, encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            canciones[int(row['cancion_id'])] = {'artista': row['artista'], 'genero': row['genero']}
+    for row in leer_tabla(session, "SELECT cancion_id, artista, genero FROM canciones"):
+        canciones[row.cancion_id] = {'artista': row.artista, 'genero': row.genero}
+    return usuarios, canciones
 
-    tendencia = defaultdict(int)
-    genero_mes = defaultdict(int)
-    artista_mes = defaultdict(int)
-    ciudad_genero = defaultdict(int)
-    canciones_por_usuario = defaultdict(lambda: defaultdict(int))
+def vaciar_tablas_olap(session):
+    """Borra el contenido de todas las tablas OLAP."""
+    for cubo in CUBOS:
+        session.execute(f"TRUNCATE {cubo.tabla}")
+    print("🧹 Tablas OLAP vaciadas")
 
-    with open(ARCHIVO_ESCUCHAS, encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            user_id = int(row['usuario_id'])
-            song_id = int(row['cancion_id'])
-            fecha = row['fecha_escucha']
-            ciudad = usuarios.get(user_id, 'desconocido')
-            cancion_info = canciones.get(song_id, {'artista': 'desconocido', 'genero': 'desconocido'})
-            artista = cancion_info['artista']
-            genero = cancion_info['genero']
-            mes = datetime.strptime(fecha, "%Y-%m-%d").strftime("%Y-%m")
+def reconstruir_olap_desde_cassandra(session, rangos=None, escaneos=None,
+                                     masivo=False, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False):
+    """
+    Recalcula las tablas OLAP a partir de las tablas base en Cassandra, sin
+    pasar por los CSV. La tabla escuchas se escanea por rangos de token con
+    varias consultas paginadas simultáneas; cada rango se agrega por separado
+    y los parciales se suman al terminar.
+    """
+    from escaneo_cassandra import escanear_por_rangos, RANGOS_POR_DEFECTO, ESCANEOS_POR_DEFECTO
 
-            tendencia[fecha] += 1
-            genero_mes[(genero, mes)] += 1
-            artista_mes[(artista, mes)] += 1
-            ciudad_genero[(ciudad, genero)] += 1
-            canciones_por_usuario[user_id][song_id] += 1
+    usuarios, canciones = cargar_dimensiones_cassandra(session)
 
-    for fecha, count in tendencia.items():
-        session.execute("INSERT INTO tendencia_por_dia (fecha, total_reproducciones) VALUES (%s, %s)", (fecha, count))
+    def agregar_rango(filas):
+        parcial = nuevos_agregados()
+        leidas = 0
+        for row in filas:
+            acumular_escucha(parcial, usuarios, canciones, row.usuario_id, row.fecha_escucha, row.cancion_id)
+            leidas += 1
+        return parcial, leidas
 
-    for (genero, mes), count in genero_mes.items():
-        session.execute("INSERT INTO reproducciones_por_genero_mes (genero, mes, reproducciones) VALUES (%s, %s, %s)", (genero, mes, count))
+    inicio = time.time()
+    agregados = nuevos_agregados()
+    escuchas = 0
+    for parcial, leidas in escanear_por_rangos(session, "escuchas", ("usuario_id", "fecha_escucha", "cancion_id"),
+                                       "usuario_id", agregar_rango,
+                                       rangos=rangos or RANGOS_POR_DEFECTO,
+                                       escaneos=escaneos or ESCANEOS_POR_DEFECTO):
+        sumar_agregados(agregados, parcial)
+        escuchas += leidas
+    print(f"🔎 Escaneo de escuchas completado en {time.time() - inicio:.2f} s")
 
-    for (artista, mes), count in artista_mes.items():
-        session.execute("INSERT INTO reproducciones_por_artista_mes (artista, mes, reproducciones) VALUES (%s, %s, %s)", (artista, mes, count))
+    # Un upsert sobre los datos anteriores dejaría celdas que ya no existen y
+    # filas de ranking duplicadas (el conteo forma parte de la clave)
+    vaciar_tablas_olap(session)
+    escribir_tablas_olap(session, agregados, masivo=masivo, en_vuelo=en_vuelo, usar_batches=usar_batches)
+    # Cambia la versión de datos que ven las consultas (y con ella sus resultados guardados)
+    guardar_marca(session, MARCA_OLAP, 0, escuchas)
+    print("✅ Tablas OLAP reconstruidas desde Cassandra.")
 
-    for (ciudad, genero), count in ciudad_genero.items():
-        session.execute("INSERT INTO reproducciones_por_ciudad_genero (ciudad, genero, reproducciones) VALUES (%s, %s, %s)", (ciudad, genero, count))
+# Pipeline de una sola pasada
+FILAS_POR_BLOQUE = 1000    # Filas parseadas que el lector entrega de una vez
+BLOQUES_EN_COLA = 64       # Bloques parseados en espera del escritor
 
-    for user_id, canciones_dict in canciones_por_usuario.items():
-        for song_id, count in canciones_dict.items():
-            session.execute("INSERT INTO top_canciones_por_usuario (id_usuario, total_reproducciones, id_cancion) VALUES (%s, %s, %s)", (user_id, count, song_id))
+def _observar(filas, funcion):
+    """Llama a funcion con cada fila antes de entregarla al escritor."""
+    for valores in filas:
+        funcion(valores)
+        yield valores
 
+def _leer_en_segundo_plano(filas):
+    """
+    Consume filas en un hilo lector y las entrega por bloques a través de
+    una cola acotada, para que el parseo se solape con las escrituras.
+    """
+    cola = queue.Queue(maxsize=BLOQUES_EN_COLA)
+    fin = object()
+    error = []
+
+    def lector():
+        try:
+            bloque = []
+            for valores in filas:
+                bloque.append(valores)
+                if len(bloque) >= FILAS_POR_BLOQUE:
+                    cola.put(bloque)
+                    bloque = []
+            if bloque:
+                cola.put(bloque)
+        except Exception as e:
+            error.append(e)
+        finally:
+            cola.put(fin)
+
+    hilo = threading.Thread(target=lector, daemon=True)
+    hilo.start()
+    while True:
+        bloque = cola.get()
+        if bloque is fin:
+            break
+        yield from bloque
+    hilo.join()
+    if error:
+        raise error[0]
+
+def cargar_pipeline(session, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False):
+    """
+    Carga tablas base y OLAP leyendo cada CSV una sola vez.
+    Las dimensiones se construyen mientras se insertan usuarios y canciones.
+    Las escuchas se parsean y agregan en un hilo lector que alimenta al
+    escritor concurrente, de modo que las escrituras se solapan con el parseo.
+    """
+    usuarios = {}
+    canciones = {}
+    agregados = nuevos_agregados()
+
+    def registrar_usuario(valores):
+        usuarios[valores[0]] = valores[2]
+
+    def registrar_cancion(valores):
+        canciones[valores[0]] = {'artista': valores[2], 'genero': valores[3]}
+
+    def registrar_escucha(valores):
+        acumular_escucha(agregados, usuarios, canciones, *valores)
+
+    cargar_filas_masivo(session, "usuarios", _preparada(INSERT_USUARIOS),
+                        _observar(leer_usuarios(), registrar_usuario),
+                        clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    print("✅ Usuarios cargados.")
+    cargar_filas_masivo(session, "canciones", _preparada(INSERT_CANCIONES),
+                        _observar(leer_canciones(), registrar_cancion),
+                        clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    print("✅ Canciones cargadas.")
+    cargar_filas_masivo(session, "escuchas", _preparada(INSERT_ESCUCHAS),
+                        _leer_en_segundo_plano(_observar(leer_escuchas(), registrar_escucha)),
+                        clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches)
+    print("✅ Escuchas cargadas.")
+
+    escribir_tablas_olap(session, agregados, masivo=True, en_vuelo=en_vuelo, usar_batches=usar_batches)
     print("✅ Tablas OLAP cargadas.")
 
+# Refresco incremental de las tablas OLAP
+def leer_escuchas_desde(archivo, offset=0):
+    """
+    Lee escuchas de archivo a partir del byte offset.
+    Devuelve el generador de filas y un diccionario cuya clave 'offset'
+    avanza hasta la última línea leída.
+    """
+    progreso = {'offset': offset}
+
+    def filas():
+        for row, posicion in leer_csv_desde(archivo, offset, solo_completas=True):
+            progreso['offset'] = posicion
+            yield _valores_escucha(row)
+
+    return filas(), progreso
+
+def leer_marca(session, archivo):
+    """Devuelve (offset, filas) ya incorporados para archivo."""
+    row = session.execute("SELECT posicion, filas FROM marcas_carga WHERE archivo = %s", (archivo,)).one()
+    if row is None:
+        return 0, 0
+    return row.posicion, row.filas
+
+def guardar_marca(session, archivo, offset, filas):
+    session.execute(
+        "INSERT INTO marcas_carga (archivo, posicion, filas, actualizado) VALUES (%s, %s, %s, toTimestamp(now()))",
+        (archivo, offset, filas)
+    )
+
+def marcar_dimensiones(session):
+    """
+    Registra en marcas_carga la carga de usuarios.csv y canciones.csv. Su fecha
+    de actualización es la versión de las dimensiones que vigila consultas_OLAP.
+    """
+    for archivo, leer in ((ARCHIVO_USUARIOS, leer_usuarios), (ARCHIVO_CANCIONES, leer_canciones)):
+        guardar_marca(session, archivo, os.path.getsize(archivo), sum(1 for _ in leer()))
+
+def marcar_carga_completa(session):
+    """
+    Registra una carga completa: las dimensiones (ver marcar_dimensiones) y
+    escuchas.csv hasta su tamaño actual, para que un --delta posterior sobre
+    ese archivo solo lea las líneas que se le agreguen.
+    """
+    marcar_dimensiones(session)
+    with open(ARCHIVO_ESCUCHAS, 'rb') as f:
+        lineas = sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(1 << 20), b''))
+    guardar_marca(session, ARCHIVO_ESCUCHAS, os.path.getsize(ARCHIVO_ESCUCHAS), max(0, lineas - 1))
+
+ARCHIVO_DELTA_PENDIENTE = '.delta_pendiente.pkl'
+
+def _planear_delta(session, cubo, delta, en_vuelo):
+    """
+    Filas finales de la tabla de cubo tras sumar delta: lee solo las filas
+    afectadas y devuelve cada una con el total acumulado (o, en los cubos de
+    oyentes, con el boceto guardado unido al del delta).
+    """
+    if not delta:
+        return []
+    claves = [cubo.columna(d) for d in cubo.dimensiones]
+    filtro = " AND ".join(f"{c} = ?" for c in claves)
+    select = session.prepare(f"SELECT {cubo.medida} FROM {cubo.tabla} WHERE {filtro}")
+
+    items = list(delta.items())
+    actuales = execute_concurrent_with_args(session, select, [k for k, _ in items],
+                                            concurrency=en_vuelo, results_generator=True)
+    filas = []
+    for (clave, suma), (success, result) in zip(items, actuales):
+        if not success:
+            raise result
+        fila = result.one()
+        actual = getattr(fila, cubo.medida) if fila else None
+        if cubo.distintos:
+            filas.append(clave + (bytes(suma.unir(HyperLogLog.desde_bytes(actual))),))
+        else:
+            filas.append(clave + ((actual or 0) + suma,))
+    return filas
+
+def _planear_delta_ranking(session, cubo, delta, en_vuelo):
+    """
+    Como _planear_delta, para un cubo cuya medida forma parte de la clave de
+    clustering (como top_canciones_por_usuario): por cada partición afectada
+    devuelve las claves de las filas anteriores a borrar y las filas nuevas.
+    """
+    if not delta:
+        return []
+    n = len(cubo.particion)
+    particion = [cubo.columna(d) for d in cubo.particion]
+    clustering = [cubo.columna(d) for d in cubo.clustering]
+    filtro = " AND ".join(f"{c} = ?" for c in particion)
+    select = session.prepare(f"SELECT {', '.join(clustering)}, {cubo.medida} FROM {cubo.tabla} WHERE {filtro}")
+
+    por_particion = defaultdict(dict)
+    for clave, suma in delta.items():
+        por_particion[clave[:n]][clave[n:]] = suma
+    claves_particion = list(por_particion)
+    particiones = execute_concurrent_with_args(session, select, claves_particion,
+                                               concurrency=en_vuelo, results_generator=True)
+    cambios = []
+    for clave_particion, (success, result) in zip(claves_particion, particiones):
+        if not success:
+            raise result
+        existentes = defaultdict(list)
+        for row in result:
+            existentes[tuple(row[:-1])].append(row[-1])
+
+        borrar, insertar = [], []
+        for resto, suma in por_particion[clave_particion].items():
+            anteriores = existentes.get(resto, [])
+            borrar.extend(clave_particion + (conteo,) + resto for conteo in anteriores)
+            insertar.append(clave_particion + resto + (max(anteriores, default=0) + suma,))
+        cambios.append((borrar, insertar))
+    return cambios
+
+def _aplicar_delta(session, plan, en_vuelo):
+    """
+    Escribe un plan {cubo: cambios} de _planear_delta*. Solo contiene
+    valores finales, así que volver a aplicarlo tras un fallo es seguro.
+    """
+    for cubo in CUBOS:
+        cambios = plan.get(cubo.nombre)
+        if not cambios:
+            continue
+        if not cubo.medida_en_clustering:
+            cargar_filas_masivo(session, cubo.tabla, _preparada(cubo.insert()), cambios, en_vuelo=en_vuelo,
+                                estricto=True)
+            continue
+
+        # Ranking: por partición, un batch que borra las filas anteriores e inserta las nuevas
+        particion = [cubo.columna(d) for d in cubo.particion]
+        clustering = [cubo.columna(d) for d in cubo.clustering]
+        delete = session.prepare(
+            f"DELETE FROM {cubo.tabla} WHERE "
+            + " AND ".join(f"{c} = ?" for c in particion + [cubo.medida] + clustering))
+        insert = session.prepare(_preparada(cubo.insert()))
+
+        def batches():
+            for borrar, insertar in cambios:
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for clave in borrar:
+                    batch.add(delete, clave)
+                for valores in insertar:
+                    batch.add(insert, valores)
+                yield batch, None
+
+        escritos = 0
+        for success, result in execute_concurrent(session, batches(), concurrency=en_vuelo,
+                                                  raise_on_first_error=True, results_generator=True):
+            escritos += 1
+        print(f"📊 {cubo.tabla}: {escritos} particiones actualizadas")
+
+def _guardar_pendiente(ruta, pendiente):
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        pickle.dump(pendiente, f)
+    os.replace(temporal, ruta)
+
+def _completar_pendiente(session, ruta, en_vuelo):
+    """Repite las escrituras y la marca de un refresco que se interrumpió tras planearlas."""
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, 'rb') as f:
+        pendiente = pickle.load(f)
+    print(f"↩️ {pendiente['archivo']}: completando el refresco interrumpido")
+    _aplicar_delta(session, pendiente['plan'], en_vuelo)
+    guardar_marca(session, pendiente['archivo'], pendiente['posicion'], pendiente['filas'])
+    os.remove(ruta)
+
+def cargar_delta(session, archivos, en_vuelo=EN_VUELO_POR_DEFECTO, usar_batches=False,
+                 pendiente=ARCHIVO_DELTA_PENDIENTE):
+    """
+    Incorpora solo las escuchas nuevas de cada archivo a las tablas OLAP.
+    Una marca por archivo (posición en bytes) registra lo ya procesado, de modo
+    que los archivos completos se saltan y los que crecieron se leen desde
+    donde quedaron. El coste es proporcional al delta, no al histórico.
+    Antes de escribir, los valores finales de las celdas afectadas y la nueva
+    marca se guardan en el archivo pendiente: si el refresco se interrumpe,
+    la siguiente ejecución los reescribe tal cual en lugar de sumar otra vez.
+    Debe ejecutarse un solo refresco a la vez.
+    """
+    _completar_pendiente(session, pendiente, en_vuelo)
+    usuarios, canciones = cargar_dimensiones()
+
+    for archivo in archivos:
+        offset, filas_previas = leer_marca(session, archivo)
+        escuchas, progreso = leer_escuchas_desde(archivo, offset)
+        agregados = nuevos_agregados()
+
+        def registrar_escucha(valores):
+            acumular_escucha(agregados, usuarios, canciones, *valores)
+
+        nuevas = cargar_filas_masivo(session, "escuchas", _preparada(INSERT_ESCUCHAS),
+                                     _observar(escuchas, registrar_escucha),
+                                     clave_particion=lambda v: v[0], en_vuelo=en_vuelo, usar_batches=usar_batches,
+                                     estricto=True)
+        if nuevas == 0:
+            print(f"⏭️ {archivo}: sin escuchas nuevas")
+            continue
+
+        plan = {}
+        for cubo in CUBOS:
+            planear = _planear_delta_ranking if cubo.medida_en_clustering else _planear_delta
+            plan[cubo.nombre] = planear(session, cubo, agregados[cubo.nombre], en_vuelo)
+        _guardar_pendiente(pendiente, {'archivo': archivo, 'posicion': progreso['offset'],
+                                       'filas': filas_previas + nuevas, 'plan': plan})
+        _aplicar_delta(session, plan, en_vuelo)
+        guardar_marca(session, archivo, progreso['offset'], filas_previas + nuevas)
+        os.remove(pendiente)
+        print(f"✅ {archivo}: {nuevas} escuchas nuevas incorporadas")
+
+# Carga reanudable con puntos de control
+ARCHIVO_CHECKPOINT = '.carga_checkpoint.json'
+SEGUNDOS_ENTRE_CHECKPOINTS = 5
+
+class Checkpoint:
+    """
+    Progreso persistente de una carga: posición en bytes confirmada de cada
+    CSV y tablas OLAP completas. Se guarda de forma atómica en un JSON.
+    """
+
+    def __init__(self, ruta=ARCHIVO_CHECKPOINT):
+        self.ruta = ruta
+        self.estado = {'archivos': {}, 'olap': []}
+        self._ultimo_guardado = 0
+        if os.path.exists(ruta):
+            with open(ruta, encoding='utf-8') as f:
+                self.estado = json.load(f)
+
+    @staticmethod
+    def _firma(archivo):
+        info = os.stat(archivo)
+        return [info.st_size, info.st_mtime]
+
+    def posicion(self, archivo):
+        """Posición confirmada de archivo, o 0 si no hay progreso o el archivo cambió."""
+        progreso = self.estado['archivos'].get(archivo)
+        if progreso is None:
+            return 0
+        if progreso['firma'] != self._firma(archivo):
+            print(f"⚠️ {archivo} cambió desde el último checkpoint: se carga desde el inicio")
+            return 0
+        return progreso['posicion']
+
+    def completo(self, archivo):
+        progreso = self.estado['archivos'].get(archivo)
+        return bool(progreso and progreso.get('completo') and progreso['firma'] == self._firma(archivo))
+
+    def avanzar(self, archivo, posicion, completo=False):
+        self.estado['archivos'][archivo] = {'posicion': posicion, 'firma': self._firma(archivo),
+                                            'completo': completo}
+        if completo or time.time() - self._ultimo_guardado >= SEGUNDOS_ENTRE_CHECKPOINTS:
+            self.guardar()
+
+    def tabla_completa(self, tabla):
+        self.estado['olap'].append(tabla)
+        self.guardar()
+
+    def guardar(self):
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.estado, f)
+        os.replace(temporal, self.ruta)
+        self._ultimo_guardado = time.time()
+
+    def eliminar(self):
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+def cargar_reanudable(session, ruta=ARCHIVO_CHECKPOINT, en_vuelo=EN_VUELO_POR_DEFECTO, **opciones_agregacion):
+    """
+    Carga tablas base y OLAP guardando puntos de control. Si una ejecución
+    anterior se interrumpió, continúa desde la última fila confirmada de cada
+    CSV y salta las tablas OLAP ya completas. Todas las escrituras son
+    upserts con los mismos valores, así que reenviar las que estaban en vuelo
+    al fallar es seguro.
+    """
+    checkpoint = Checkpoint(ruta)
+
+    cargas_base = [
+        ("usuarios", ARCHIVO_USUARIOS, INSERT_USUARIOS, _valores_usuario, "✅ Usuarios cargados."),
+        ("canciones", ARCHIVO_CANCIONES, INSERT_CANCIONES, _valores_cancion, "✅ Canciones cargadas."),
+        ("escuchas", ARCHIVO_ESCUCHAS, INSERT_ESCUCHAS, _valores_escucha, "✅ Escuchas cargadas."),
+    ]
+    for tabla, archivo, query, convertir, mensaje in cargas_base:
+        if checkpoint.completo(archivo):
+            print(f"⏭️ {tabla}: ya cargada")
+            continue
+        posicion = checkpoint.posicion(archivo)
+        if posicion:
+            print(f"↩️ {tabla}: reanudando desde el byte {posicion}")
+        filas = ((convertir(row), fin) for row, fin in leer_csv_desde(archivo, posicion))
+        cargar_filas_masivo(session, tabla, _preparada(query), filas, en_vuelo=en_vuelo,
+                            al_confirmar=lambda fin, archivo=archivo: checkpoint.avanzar(archivo, fin))
+        checkpoint.avanzar(archivo, os.path.getsize(archivo), completo=True)
+        print(mensaje)
+
+    agregados, liberar = calcular_agregados(**opciones_agregacion)
+    try:
+        escribir_tablas_olap(session, agregados, masivo=True, en_vuelo=en_vuelo,
+                             omitir=set(checkpoint.estado['olap']), al_completar=checkpoint.tabla_completa)
+    finally:
+        liberar()
+    print("✅ Tablas OLAP cargadas.")
+    checkpoint.eliminar()
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Crea el keyspace, las tablas y carga los datos en Cassandra.")
+    parser.add_argument("--masivo", action="store_true",
+                        help="Carga masiva con sentencias preparadas y escrituras concurrentes")
+    parser.add_argument("--en-vuelo", type=int, default=EN_VUELO_POR_DEFECTO,
+                        help="Máximo de escrituras simultáneas en modo masivo")
+    parser.add_argument("--batches", action="store_true",
+                        help="Agrupa filas de la misma partición en batches UNLOGGED (modo masivo)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Lee cada CSV una sola vez y alimenta a la vez tablas base y agregados OLAP")
+    agregacion = parser.add_mutually_exclusive_group()
+    agregacion.add_argument("--memoria-mb", type=int,
+                            help="Presupuesto de memoria de la agregación OLAP; el excedente se vuelca a disco")
+    agregacion.add_argument("--procesos", type=int, nargs="?", const=0,
+                            help="Agrega escuchas.csv en paralelo con N procesos (sin valor: todos los núcleos)")
+    agregacion.add_argument("--columnar", action="store_true",
+                            help="Agrega escuchas.csv por bloques con operaciones vectorizadas (numpy)")
+    agregacion.add_argument("--cache", action="store_true",
+                            help="Agregación columnar sobre una cache binaria de escuchas.csv mapeada en memoria")
+    parser.add_argument("--reanudable", nargs="?", const=ARCHIVO_CHECKPOINT, metavar="CHECKPOINT",
+                        help="Guarda puntos de control y reanuda una carga interrumpida desde el último")
+    parser.add_argument("--desde-cassandra", action="store_true",
+                        help="Recalcula las tablas OLAP escaneando las tablas base en Cassandra en lugar de los CSV")
+    parser.add_argument("--rangos", type=int,
+                        help="Rangos de token en que se divide el escaneo de escuchas (--desde-cassandra)")
+    parser.add_argument("--escaneos", type=int,
+                        help="Consultas de rango simultáneas (--desde-cassandra)")
+    parser.add_argument("--delta", nargs="+", metavar="ARCHIVO",
+                        help="Incorpora solo las escuchas nuevas de estos archivos a las tablas OLAP")
+    args = parser.parse_args(argv)
+    if args.reanudable and args.batches:
+        parser.error("--reanudable no admite --batches")
+    return args
+
 # Ejecutar todo
-def main():
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    opciones_carga = dict(masivo=args.masivo, en_vuelo=args.en_vuelo, usar_batches=args.batches)
+
     session = conectar_cassandra()
     crear_tablas(session)
-    cargar_usuarios(session)
-    cargar_canciones(session)
-    cargar_escuchas(session)
-    cargar_tablas_olap(session)
+    if args.desde_cassandra:
+        reconstruir_olap_desde_cassandra(session, rangos=args.rangos, escaneos=args.escaneos, **opciones_carga)
+    elif args.delta:
+        cargar_delta(session, args.delta, en_vuelo=args.en_vuelo, usar_batches=args.batches)
+    elif args.reanudable:
+        cargar_reanudable(session, args.reanudable, en_vuelo=args.en_vuelo, memoria_mb=args.memoria_mb,
+                          procesos=args.procesos, columnar=args.columnar, cache=args.cache)
+    elif args.pipeline:
+        cargar_pipeline(session, en_vuelo=args.en_vuelo, usar_batches=args.batches)
+    else:
+        cargar_usuarios(session, **opciones_carga)
+        cargar_canciones(session, **opciones_carga)
+        cargar_escuchas(session, **opciones_carga)
+        cargar_tablas_olap(session, memoria_mb=args.memoria_mb, procesos=args.procesos,
+                           columnar=args.columnar, cache=args.cache, **opciones_carga)
+    if not (args.desde_cassandra or args.delta):
+        marcar_carga_completa(session)
     print("🎉 Base de datos creada y cargada exitosamente.")
 
 if __name__ == '__main__':
@@ -0,0 +1,188 @@
+# Registro declarativo de los cubos OLAP: de cada definición salen la tabla,
+# la agregación y las escrituras del cargador, y las consultas de consultas_OLAP.
+# Para agregar un cubo basta con agregarlo a CUBOS.
+from collections import defaultdict
+
+try:
+    from .hyperloglog import HyperLogLog
+except ImportError:
+    # Importado desde datos/ (cargador y scripts), sin el paquete
+    from hyperloglog import HyperLogLog
+
+# Dimensiones de una escucha y su tipo CQL
+DIMENSIONES = {
+    'usuario': 'int',
+    'cancion': 'int',
+    'fecha': 'text',
+    'mes': 'text',
+    'ciudad': 'text',
+    'artista': 'text',
+    'genero': 'text',
+}
+# Orden de los valores que devuelve valores_escucha()
+ORDEN_DIMENSIONES = tuple(DIMENSIONES)
+DIMENSIONES_TIEMPO = ('fecha', 'mes')
+# Bits de cada dimensión numérica al empaquetar claves enteras (fecha AAAAMMDD,
+# mes AAAAMM); las de texto usan los bits de su diccionario
+BITS_DIMENSION = {'usuario': 31, 'cancion': 31, 'fecha': 27, 'mes': 20}
+BITS_CLAVE = 63
+
+def valores_escucha(usuario_id, cancion_id, fecha, ciudad, artista, genero):
+    """Valores de todas las dimensiones de una escucha, en ORDEN_DIMENSIONES."""
+    return (usuario_id, cancion_id, fecha, fecha[:7], ciudad, artista, genero)
+
+def fecha_texto(codigo):
+    return f"{codigo // 10000:04d}-{codigo // 100 % 100:02d}-{codigo % 100:02d}"
+
+def mes_texto(codigo):
+    return f"{codigo // 100:04d}-{codigo % 100:02d}"
+
+class Cubo:
+    """
+    Conteo de escuchas por dimensiones. La tabla se particiona por las
+    primeras `particion` dimensiones y se ordena por las demás. Con
+    medida_en_clustering la medida forma parte de la clave (descendente),
+    como en los rankings; esas tablas no se actualizan sumando en el lugar.
+    columnas renombra dimensiones en la tabla (dimensión -> columna).
+    Con distintos la medida es un boceto HyperLogLog de los usuarios que
+    escucharon (blob): no se suma, se une registro a registro.
+    """
+
+    def __init__(self, nombre, tabla, dimensiones, particion=1, medida='reproducciones',
+                 columnas=None, medida_en_clustering=False, distintos=False):
+        self.nombre = nombre
+        self.tabla = tabla
+        self.dimensiones = tuple(dimensiones)
+        self.particion = self.dimensiones[:particion]
+        self.clustering = self.dimensiones[particion:]
+        self.medida = medida
+        self.columnas = dict(columnas or {})
+        self.medida_en_clustering = medida_en_clustering
+        self.distintos = distintos
+        self.indices = tuple(ORDEN_DIMENSIONES.index(d) for d in self.dimensiones)
+
+    def __repr__(self):
+        return f"Cubo({self.nombre!r}, {self.dimensiones!r})"
+
+    @property
+    def aditivo(self):
+        return not self.medida_en_clustering and not self.distintos
+
+    @property
+    def tiempo(self):
+        """Dimensión de tiempo del cubo (fecha o mes), o None."""
+        return next((d for d in self.dimensiones if d in DIMENSIONES_TIEMPO), None)
+
+    def columna(self, dimension):
+        return self.columnas.get(dimension, dimension)
+
+    def clave(self, valores):
+        """Clave del cubo a partir de valores_escucha()."""
+        return tuple(valores[i] for i in self.indices)
+
+    def contador(self):
+        """Diccionario vacío clave -> medida (conteo o boceto) para agregar el cubo."""
+        return defaultdict(HyperLogLog if self.distintos else int)
+
+    def sumar(self, destino, origen):
+        """Suma en destino los valores de origen (o los une, si son bocetos)."""
+        if self.distintos:
+            for clave, boceto in origen.items():
+                destino[clave].unir(boceto)
+        else:
+            for clave, conteo in origen.items():
+                destino[clave] += conteo
+
+    # CQL
+    def crear_tabla(self):
+        tipo = 'blob' if self.distintos else 'int'
+        columnas = [f"{self.columna(d)} {DIMENSIONES[d]}" for d in self.dimensiones] + [f"{self.medida} {tipo}"]
+        particion = ", ".join(self.columna(d) for d in self.particion)
+        if len(self.particion) > 1:
+            particion = f"({particion})"
+        clustering = [self.columna(d) for d in self.clustering]
+        orden = ""
+        if self.medida_en_clustering:
+            orden = " WITH CLUSTERING ORDER BY ({})".format(
+                ", ".join([f"{self.medida} DESC"] + [f"{c} ASC" for c in clustering]))
+            clustering.insert(0, self.medida)
+        clave = ", ".join([particion] + clustering)
+        definicion = ",\n                ".join(columnas + [f"PRIMARY KEY ({clave})"])
+        return f"""
+            CREATE TABLE IF NOT EXISTS {self.tabla} (
+                {definicion}
+            ){orden};
+        """
+
+    def insert(self):
+        columnas = [self.columna(d) for d in self.dimensiones] + [self.medida]
+        return (f"INSERT INTO {self.tabla} ({', '.join(columnas)}) "
+                f"VALUES ({', '.join(['%s'] * len(columnas))})")
+
+    def select(self):
+        columnas = [self.columna(d) for d in self.dimensiones] + [self.medida]
+        return f"SELECT {', '.join(columnas)} FROM {self.tabla}"
+
+    @property
+    def rango_particion(self):
+        """True si la lectura de una partición se acota por un rango de tiempo."""
+        return bool(self.clustering) and self.clustering[0] in DIMENSIONES_TIEMPO
+
+    @property
+    def nombre_particion(self):
+        return f"{self.nombre}_de_{'_y_'.join(self.particion)}"
+
+    def select_particion(self):
+        """
+        SELECT de una partición. Si la primera columna de clustering es de
+        tiempo, lleva además un rango inclusivo sobre ella.
+        """
+        filtro = [f"{self.columna(d)} = ?" for d in self.particion]
+        if self.rango_particion:
+            tiempo = self.columna(self.clustering[0])
+            filtro += [f"{tiempo} >= ?", f"{tiempo} <= ?"]
+        return f"{self.select()} WHERE {' AND '.join(filtro)}"
+
+    def empaquetado(self, bits, reservados=0):
+        """
+        (desplazamiento, máscara) de cada dimensión al empaquetar la clave en
+        un entero. bits es {dimensión de texto: bits de su diccionario};
+        reservados son bits que el llamador necesita libres a la derecha.
+        """
+        anchos = [bits[d] if d in bits else BITS_DIMENSION[d] for d in self.dimensiones]
+        if sum(anchos) > BITS_CLAVE - reservados:
+            raise ValueError(f"{self.nombre}: la clave no cabe en {BITS_CLAVE - reservados} bits")
+        resultado = []
+        desplazamiento = sum(anchos)
+        for ancho in anchos:
+            desplazamiento -= ancho
+            resultado.append((desplazamiento, (1 << ancho) - 1))
+        return resultado
+
+# Cubos materializados, de menor a mayor tamaño esperado
+CUBOS = (
+    Cubo('tendencia', 'tendencia_por_dia', ('fecha',), medida='total_reproducciones'),
+    # Tendencia diaria en particiones de un mes (opcionalmente por género o ciudad),
+    # para leer un rango de fechas sin recorrer toda la tabla
+    Cubo('tendencia_diaria', 'tendencia_diaria', ('mes', 'fecha'), medida='total_reproducciones'),
+    Cubo('genero_mes', 'reproducciones_por_genero_mes', ('genero', 'mes')),
+    Cubo('ciudad_genero', 'reproducciones_por_ciudad_genero', ('ciudad', 'genero')),
+    Cubo('artista_mes', 'reproducciones_por_artista_mes', ('artista', 'mes')),
+    Cubo('tendencia_genero', 'tendencia_diaria_por_genero', ('genero', 'mes', 'fecha'), particion=2,
+         medida='total_reproducciones'),
+    Cubo('tendencia_ciudad', 'tendencia_diaria_por_ciudad', ('ciudad', 'mes', 'fecha'), particion=2,
+         medida='total_reproducciones'),
+    Cubo('ciudad_genero_mes', 'reproducciones_por_ciudad_genero_mes', ('ciudad', 'genero', 'mes')),
+    Cubo('canciones_por_usuario', 'top_canciones_por_usuario', ('usuario', 'cancion'),
+         medida='total_reproducciones', columnas={'usuario': 'id_usuario', 'cancion': 'id_cancion'},
+         medida_en_clustering=True),
+    # Oyentes distintos (bocetos HyperLogLog) de los que se derivan los roll-ups
+    Cubo('oyentes_genero_mes', 'oyentes_por_genero_mes', ('genero', 'mes', 'ciudad'),
+         medida='oyentes', distintos=True),
+    Cubo('oyentes_artista_ciudad', 'oyentes_por_artista_ciudad', ('artista', 'ciudad'),
+         medida='oyentes', distintos=True),
+)
+CUBOS_POR_NOMBRE = {cubo.nombre: cubo for cubo in CUBOS}
+# Cubos que cuentan escuchas y cubos que registran oyentes distintos
+CUBOS_CONTEO = tuple(cubo for cubo in CUBOS if not cubo.distintos)
+CUBOS_DISTINTOS = tuple(cubo for cubo in CUBOS if cubo.distintos)
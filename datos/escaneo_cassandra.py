@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cassandra.query import SimpleStatement
+
+# Límites del anillo de tokens del particionador Murmur3
+TOKEN_MIN = -2 ** 63
+TOKEN_MAX = 2 ** 63 - 1
+
+RANGOS_POR_DEFECTO = 256       # Subrangos de token en que se divide el escaneo
+ESCANEOS_POR_DEFECTO = 16      # Consultas de rango simultáneas
+FILAS_POR_PAGINA = 5000        # Fetch size de cada consulta de rango
+
+def rangos_de_token(cantidad):
+    """Divide el anillo completo en cantidad de rangos (inicio, fin]."""
+    paso = (TOKEN_MAX - TOKEN_MIN) // cantidad
+    limites = [TOKEN_MIN + i * paso for i in range(cantidad)] + [TOKEN_MAX]
+    return [(limites[i], limites[i + 1]) for i in range(cantidad)]
+
+def leer_tabla(session, query, fetch_size=FILAS_POR_PAGINA):
+    """Recorre una tabla completa con lectura paginada."""
+    return session.execute(SimpleStatement(query, fetch_size=fetch_size))
+
+def escanear_por_rangos(session, tabla, columnas, clave_particion, procesar_rango,
+                        rangos=RANGOS_POR_DEFECTO, escaneos=ESCANEOS_POR_DEFECTO,
+                        fetch_size=FILAS_POR_PAGINA):
+    """
+    Escanea tabla completa dividiéndola en rangos de token que se consultan
+    en paralelo, cada uno con lectura paginada. procesar_rango recibe las
+    filas de un rango y su resultado se entrega a medida que cada rango
+    termina.
+    """
+    query = (f"SELECT {', '.join(columnas)} FROM {tabla} "
+             f"WHERE token({clave_particion}) > ? AND token({clave_particion}) <= ?")
+    stmt = session.prepare(query)
+    stmt.fetch_size = fetch_size
+
+    def escanear(rango):
+        return procesar_rango(session.execute(stmt, rango))
+
+    with ThreadPoolExecutor(max_workers=escaneos) as pool:
+        futuros = [pool.submit(escanear, rango) for rango in rangos_de_token(rangos)]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
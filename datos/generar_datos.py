@@ -0,0 +1,97 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+from datetime import date, timedelta
+
+# Listas base para nombres, ciudades, artistas y géneros sintéticos
+NOMBRES = ["Ana", "Carlos", "Laura", "Javier", "Maria", "Luis", "Sofia", "Diego", "Valentina", "Andres"]
+APELLIDOS = ["Perez", "Gomez", "Torres", "Ruiz", "Rodriguez", "Martinez", "Lopez", "Sanchez", "Diaz", "Romero"]
+GENEROS = ["Rock", "Pop", "Reggaeton", "Salsa", "Bachata", "Merengue", "Jazz", "Blues", "R&B", "Hip Hop",
+           "Electronica", "Cumbia", "Vallenato", "Grunge", "Metal", "Indie", "Folk", "Clasica", "Trap", "Bolero"]
+
+FILAS_POR_BLOQUE = 100000    # Escuchas generadas y escritas de una vez
+
+def pesos_zipf(cantidad, exponente):
+    """Pesos acumulados de una distribución tipo Zipf sobre cantidad elementos."""
+    return list(itertools.accumulate(1.0 / (rango ** exponente) for rango in range(1, cantidad + 1)))
+
+def generar_usuarios(archivo, cantidad, ciudades, rnd):
+    with open(archivo, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['usuario_id', 'nombre', 'ciudad'])
+        for usuario_id in range(1, cantidad + 1):
+            nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}"
+            writer.writerow([usuario_id, nombre, rnd.choice(ciudades)])
+
+def generar_canciones(archivo, cantidad, artistas, generos, rnd):
+    with open(archivo, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cancion_id', 'titulo', 'artista', 'genero'])
+        for cancion_id in range(1, cantidad + 1):
+            writer.writerow([cancion_id, f"Cancion {cancion_id}", rnd.choice(artistas), rnd.choice(generos)])
+
+def generar_escuchas(archivo, cantidad, usuarios, canciones, fechas, rnd,
+                     sesgo_canciones=1.1, sesgo_usuarios=0.6):
+    """
+    Escribe cantidad de escuchas con popularidad de canciones y actividad
+    de usuarios sesgadas (Zipf). Los ids más bajos son los más frecuentes.
+    """
+    ids_usuarios = range(1, usuarios + 1)
+    ids_canciones = range(1, canciones + 1)
+    pesos_usuarios = pesos_zipf(usuarios, sesgo_usuarios)
+    pesos_canciones = pesos_zipf(canciones, sesgo_canciones)
+
+    with open(archivo, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['usuario_id', 'cancion_id', 'fecha_escucha'])
+        restantes = cantidad
+        while restantes > 0:
+            k = min(FILAS_POR_BLOQUE, restantes)
+            writer.writerows(zip(
+                rnd.choices(ids_usuarios, cum_weights=pesos_usuarios, k=k),
+                rnd.choices(ids_canciones, cum_weights=pesos_canciones, k=k),
+                rnd.choices(fechas, k=k),
+            ))
+            restantes -= k
+
+def generar_dataset(directorio, usuarios=1000, canciones=5000, escuchas=100000,
+                    ciudades=200, artistas=1000, generos=len(GENEROS),
+                    desde=date(2022, 1, 1), meses=24, semilla=42):
+    """Genera usuarios.csv, canciones.csv y escuchas.csv en directorio."""
+    rnd = random.Random(semilla)
+    os.makedirs(directorio, exist_ok=True)
+
+    lista_ciudades = [f"Ciudad {i}" for i in range(1, ciudades + 1)]
+    lista_artistas = [f"Artista {i}" for i in range(1, artistas + 1)]
+    lista_generos = GENEROS[:generos] + [f"Genero {i}" for i in range(len(GENEROS) + 1, generos + 1)]
+    dias = meses * 365 // 12
+    fechas = [(desde + timedelta(days=d)).isoformat() for d in range(dias)]
+
+    generar_usuarios(os.path.join(directorio, 'usuarios.csv'), usuarios, lista_ciudades, rnd)
+    generar_canciones(os.path.join(directorio, 'canciones.csv'), canciones, lista_artistas, lista_generos, rnd)
+    generar_escuchas(os.path.join(directorio, 'escuchas.csv'), escuchas, usuarios, canciones, fechas, rnd)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de usuarios, canciones y escuchas.")
+    parser.add_argument("--salida", default="sinteticos", help="Directorio de salida")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--canciones", type=int, default=5000)
+    parser.add_argument("--escuchas", type=int, default=100000)
+    parser.add_argument("--ciudades", type=int, default=200)
+    parser.add_argument("--artistas", type=int, default=1000)
+    parser.add_argument("--generos", type=int, default=len(GENEROS))
+    parser.add_argument("--desde", type=date.fromisoformat, default=date(2022, 1, 1),
+                        help="Primera fecha de escucha (AAAA-MM-DD)")
+    parser.add_argument("--meses", type=int, default=24, help="Meses cubiertos por las escuchas")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    generar_dataset(args.salida, usuarios=args.usuarios, canciones=args.canciones, escuchas=args.escuchas,
+                    ciudades=args.ciudades, artistas=args.artistas, generos=args.generos,
+                    desde=args.desde, meses=args.meses, semilla=args.semilla)
+    print(f"✅ Datos sintéticos generados en {args.salida}/")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import math
+from functools import lru_cache
+
+# 2^PRECISION registros: error relativo típico de 1.04 / sqrt(2048) ≈ 2.3 %
+PRECISION = 11
+REGISTROS = 1 << PRECISION
+BITS_RESTO = 64 - PRECISION
+# Registros no nulos que se guardan en memoria como diccionario antes de pasar
+# al array denso: cada par cuesta ~60 bytes, así que hasta aquí el diccionario
+# ocupa menos que los REGISTROS bytes del array (y ningún boceto pasa de ~2.2 KB)
+MAX_DISPERSO = 32
+BYTES_EN_MEMORIA = REGISTROS + 100
+# En el blob serializado cada par ocupa 3 bytes: hasta aquí se guardan como pares
+MAX_PARES_BLOB = REGISTROS // 4
+MASCARA_64 = (1 << 64) - 1
+ALFA = 0.7213 / (1 + 1.079 / REGISTROS)
+
+# Primer byte del blob serializado
+DISPERSO = 1
+DENSO = 2
+
+def hash64(valor):
+    """Hash de 64 bits de un entero (splitmix64), igual al de agregacion_columnar."""
+    z = (valor + 0x9E3779B97F4A7C15) & MASCARA_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASCARA_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASCARA_64
+    return z ^ (z >> 31)
+
+@lru_cache(maxsize=1 << 16)
+def posicion(valor):
+    """(registro, rango) de valor: los primeros bits del hash eligen el registro."""
+    h = hash64(valor)
+    return h >> BITS_RESTO, BITS_RESTO - (h & ((1 << BITS_RESTO) - 1)).bit_length() + 1
+
+class HyperLogLog:
+    """
+    Boceto de cardinalidad: estima cuántos valores distintos se agregaron
+    con memoria acotada (como mucho BYTES_EN_MEMORIA). Dos bocetos se unen
+    tomando el máximo de cada registro, así que el de varias celdas de un
+    cubo se obtiene sin volver a leer las escuchas. Mientras hay pocos
+    registros no nulos se guardan en un diccionario (forma dispersa).
+    """
+
+    __slots__ = ('disperso', 'registros')
+
+    def __init__(self):
+        self.disperso = {}
+        self.registros = None
+
+    def agregar(self, valor):
+        indice, rango = posicion(valor)
+        self._subir(indice, rango)
+
+    def _subir(self, indice, rango):
+        if self.registros is not None:
+            if rango > self.registros[indice]:
+                self.registros[indice] = rango
+        elif rango > self.disperso.get(indice, 0):
+            self.disperso[indice] = rango
+            if len(self.disperso) > MAX_DISPERSO:
+                self._densificar()
+
+    def _densificar(self):
+        self.registros = bytearray(REGISTROS)
+        for indice, rango in self.disperso.items():
+            self.registros[indice] = rango
+        self.disperso = None
+
+    def unir(self, otro):
+        """Une otro boceto a este y lo devuelve."""
+        if otro.registros is None:
+            for indice, rango in otro.disperso.items():
+                self._subir(indice, rango)
+        elif self.registros is None:
+            disperso = self.disperso
+            self.registros = bytearray(otro.registros)
+            self.disperso = None
+            for indice, rango in disperso.items():
+                self._subir(indice, rango)
+        else:
+            self.registros = bytearray(map(max, self.registros, otro.registros))
+        return self
+
+    def estimar(self):
+        """Cantidad estimada de valores distintos."""
+        if self.registros is None:
+            valores = self.disperso.values()
+            ceros = REGISTROS - len(self.disperso)
+            suma = ceros + sum(2.0 ** -r for r in valores)
+        else:
+            ceros = self.registros.count(0)
+            suma = sum(2.0 ** -r for r in self.registros)
+        estimacion = ALFA * REGISTROS * REGISTROS / suma
+        # Corrección para cardinalidades pequeñas (conteo lineal)
+        if estimacion <= 2.5 * REGISTROS and ceros:
+            estimacion = REGISTROS * math.log(REGISTROS / ceros)
+        return round(estimacion)
+
+    @classmethod
+    def desde_pares(cls, indices, rangos):
+        """Boceto con los registros dados (índices sin repetir)."""
+        boceto = cls()
+        if len(indices) > MAX_DISPERSO:
+            boceto._densificar()
+            for indice, rango in zip(indices, rangos):
+                boceto.registros[indice] = rango
+        else:
+            boceto.disperso = dict(zip(indices, rangos))
+        return boceto
+
+    def __bytes__(self):
+        """
+        Blob compacto: pares (índice de 2 bytes, rango) si hay como mucho
+        MAX_PARES_BLOB registros no nulos, o los registros completos. Solo
+        depende del contenido, no de la forma en memoria.
+        """
+        if self.registros is None:
+            pares = sorted(self.disperso.items())
+        elif REGISTROS - self.registros.count(0) <= MAX_PARES_BLOB:
+            pares = [(indice, rango) for indice, rango in enumerate(self.registros) if rango]
+        else:
+            return bytes([DENSO]) + bytes(self.registros)
+        datos = bytearray([DISPERSO])
+        for indice, rango in pares:
+            datos += bytes((indice >> 8, indice & 0xFF, rango))
+        return bytes(datos)
+
+    @classmethod
+    def desde_bytes(cls, datos):
+        boceto = cls()
+        if not datos:
+            return boceto
+        if datos[0] == DENSO:
+            boceto.registros = bytearray(datos[1:])
+            boceto.disperso = None
+        else:
+            pares = range(1, len(datos), 3)
+            boceto = cls.desde_pares([(datos[i] << 8) | datos[i + 1] for i in pares], [datos[i + 2] for i in pares])
+        return boceto
+
+    def __repr__(self):
+        return f"HyperLogLog(~{self.estimar()})"
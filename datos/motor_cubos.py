@@ -0,0 +1,243 @@
+import argparse
+import time
+
+import numpy as np
+
+from agregacion_columnar import _buscar, codificar_dimensiones
+from cubos_olap import fecha_texto, mes_texto
+
+# Dimensiones por las que se puede agrupar o filtrar
+DIMENSIONES = ('genero', 'artista', 'ciudad', 'mes', 'fecha', 'usuario', 'cancion')
+# Dimensiones codificadas con diccionario (código -> texto)
+DICCIONARIOS = ('genero', 'artista', 'ciudad')
+# Combinaciones de claves por debajo de este tamaño se cuentan con bincount
+MAX_CELDAS_BINCOUNT = 1 << 24
+LIMITE_CLAVE = 1 << 62
+
+def _compacto(valores, maximo):
+    """Convierte valores al entero sin signo más pequeño que admite maximo."""
+    return valores.astype(np.min_scalar_type(max(int(maximo), 0)), copy=False)
+
+def _fecha_codigo(texto):
+    anio, mes, dia = texto.split('-')
+    return int(anio) * 10000 + int(mes) * 100 + int(dia)
+
+def _mes_codigo(texto):
+    anio, mes = texto.split('-')[:2]
+    return int(anio) * 100 + int(mes)
+
+class MotorCubos:
+    """
+    Tabla de hechos escuchas en memoria como columnas de enteros, con las
+    dimensiones de usuarios y canciones codificadas por diccionario.
+    Responde agrupaciones, filtros y conteos sobre cualquier subconjunto de
+    DIMENSIONES con operaciones vectorizadas de numpy.
+    """
+
+    def __init__(self, usuario, cancion, fecha, dimensiones):
+        usuario = np.asarray(usuario)
+        cancion = np.asarray(cancion)
+        fecha = np.asarray(fecha)
+        self.filas = len(usuario)
+        self.textos = {'genero': dimensiones.generos, 'artista': dimensiones.artistas,
+                       'ciudad': dimensiones.ciudades}
+
+        ids_usuario = usuario.astype(np.int64, copy=False)
+        ids_cancion = cancion.astype(np.int64, copy=False)
+        self.columnas = {
+            'usuario': usuario,
+            'cancion': cancion,
+            'fecha': fecha,
+            'mes': _compacto(fecha // 100, fecha.max(initial=0) // 100),
+            'genero': _compacto(_buscar(dimensiones.genero_por_cancion, ids_cancion), len(dimensiones.generos)),
+            'artista': _compacto(_buscar(dimensiones.artista_por_cancion, ids_cancion), len(dimensiones.artistas)),
+            'ciudad': _compacto(_buscar(dimensiones.ciudad_por_usuario, ids_usuario), len(dimensiones.ciudades)),
+        }
+        # Rango [mínimo, máximo] de cada columna, para combinar claves sin colisiones
+        self.rangos = {nombre: (int(valores.min()), int(valores.max())) if valores.size else (0, 0)
+                       for nombre, valores in self.columnas.items()}
+
+    @classmethod
+    def desde_csv(cls, archivo_escuchas, archivo_usuarios, archivo_canciones, cargar_dimensiones):
+        """Carga el motor desde la cache binaria columnar de los CSV (ver cache_columnar)."""
+        from cache_columnar import abrir_dimensiones, abrir_escuchas
+
+        inicio = time.time()
+        usuario, cancion, fecha = abrir_escuchas(archivo_escuchas)
+        dimensiones = abrir_dimensiones(archivo_usuarios, archivo_canciones, cargar_dimensiones)
+        motor = cls(usuario, cancion, fecha, dimensiones)
+        print(f"🧊 Motor de cubos: {motor.filas} escuchas cargadas en {time.time() - inicio:.2f} s")
+        return motor
+
+    @classmethod
+    def desde_cassandra(cls, session, rangos=None, escaneos=None):
+        """Carga el motor escaneando escuchas, usuarios y canciones en Cassandra."""
+        from cargar_datos_cassandra import cargar_dimensiones_cassandra
+        from escaneo_cassandra import ESCANEOS_POR_DEFECTO, RANGOS_POR_DEFECTO, escanear_por_rangos
+
+        def leer_rango(filas):
+            usuarios, canciones, fechas = [], [], []
+            for row in filas:
+                usuarios.append(row.usuario_id)
+                canciones.append(row.cancion_id)
+                fechas.append(_fecha_codigo(row.fecha_escucha))
+            return (np.array(usuarios, dtype=np.int32), np.array(canciones, dtype=np.int32),
+                    np.array(fechas, dtype=np.int32))
+
+        inicio = time.time()
+        dimensiones = codificar_dimensiones(*cargar_dimensiones_cassandra(session))
+        partes = list(escanear_por_rangos(session, "escuchas", ("usuario_id", "fecha_escucha", "cancion_id"),
+                                          "usuario_id", leer_rango,
+                                          rangos=rangos or RANGOS_POR_DEFECTO,
+                                          escaneos=escaneos or ESCANEOS_POR_DEFECTO))
+        columnas = [np.concatenate([parte[i] for parte in partes]) if partes else np.zeros(0, dtype=np.int32)
+                    for i in range(3)]
+        motor = cls(*columnas, dimensiones)
+        print(f"🧊 Motor de cubos: {motor.filas} escuchas leídas de Cassandra en {time.time() - inicio:.2f} s")
+        return motor
+
+    def _codigo(self, dimension, valor):
+        """Código interno de un valor de filtro; None si no existe en los datos."""
+        if dimension in DICCIONARIOS:
+            if not hasattr(self, '_codigos'):
+                self._codigos = {d: {t: i for i, t in enumerate(self.textos[d])} for d in DICCIONARIOS}
+            return self._codigos[dimension].get(valor)
+        if dimension == 'mes':
+            return _mes_codigo(valor) if isinstance(valor, str) else int(valor)
+        if dimension == 'fecha':
+            return _fecha_codigo(valor) if isinstance(valor, str) else int(valor)
+        return int(valor)
+
+    def _mascara(self, filtros, desde, hasta):
+        """Filas que cumplen todos los filtros y el rango de fechas [desde, hasta]."""
+        mascara = None
+
+        def y(condicion):
+            nonlocal mascara
+            mascara = condicion if mascara is None else mascara & condicion
+
+        for dimension, valor in (filtros or {}).items():
+            if dimension not in DIMENSIONES:
+                raise ValueError(f"Dimensión desconocida: {dimension}")
+            columna = self.columnas[dimension]
+            if isinstance(valor, (list, tuple, set, frozenset)):
+                codigos = [c for c in (self._codigo(dimension, v) for v in valor) if c is not None]
+                y(np.isin(columna, codigos))
+            else:
+                codigo = self._codigo(dimension, valor)
+                y(columna == codigo if codigo is not None else np.zeros(self.filas, dtype=bool))
+        if desde is not None:
+            y(self.columnas['fecha'] >= _fecha_codigo(desde))
+        if hasta is not None:
+            y(self.columnas['fecha'] <= _fecha_codigo(hasta))
+        return mascara
+
+    def _clave(self, agrupar, mascara):
+        """
+        Combina las columnas de agrupar en una sola clave entera (base mixta
+        según el rango de cada columna). Devuelve la clave, las bases y los
+        mínimos para separarla después.
+        """
+        bases, minimos = [], []
+        for dimension in agrupar:
+            minimo, maximo = self.rangos[dimension]
+            minimos.append(minimo)
+            bases.append(maximo - minimo + 1)
+        if np.prod([float(b) for b in bases]) >= LIMITE_CLAVE:
+            raise ValueError(f"Demasiadas combinaciones para agrupar por {', '.join(agrupar)}")
+
+        clave = None
+        for dimension, base, minimo in zip(agrupar, bases, minimos):
+            columna = self.columnas[dimension]
+            if mascara is not None:
+                columna = columna[mascara]
+            columna = columna.astype(np.int64) - minimo
+            clave = columna if clave is None else clave * base + columna
+        return clave, bases, minimos
+
+    def _valor(self, dimension, codigos):
+        if dimension in DICCIONARIOS:
+            textos = self.textos[dimension]
+            return [textos[c] for c in codigos]
+        if dimension == 'mes':
+            return [mes_texto(c) for c in codigos]
+        if dimension == 'fecha':
+            return [fecha_texto(c) for c in codigos]
+        return codigos
+
+    def consultar(self, agrupar=(), filtros=None, desde=None, hasta=None, limite=None):
+        """
+        Cuenta escuchas agrupadas por las dimensiones de agrupar.
+        filtros es {dimensión: valor o lista de valores}; desde y hasta
+        ('AAAA-MM-DD') acotan la fecha. Devuelve una lista de diccionarios
+        con las dimensiones y 'reproducciones', de mayor a menor conteo
+        (solo los primeros limite si se indica).
+        """
+        agrupar = tuple(agrupar)
+        for dimension in agrupar:
+            if dimension not in DIMENSIONES:
+                raise ValueError(f"Dimensión desconocida: {dimension}")
+        mascara = self._mascara(filtros, desde, hasta)
+
+        if not agrupar:
+            total = self.filas if mascara is None else int(np.count_nonzero(mascara))
+            return [{'reproducciones': total}]
+
+        clave, bases, minimos = self._clave(agrupar, mascara)
+        celdas = int(np.prod([float(b) for b in bases]))
+        if celdas <= max(MAX_CELDAS_BINCOUNT, 2 * len(clave)):
+            conteos = np.bincount(clave, minlength=celdas)
+            claves = np.flatnonzero(conteos)
+            conteos = conteos[claves]
+        else:
+            claves, conteos = np.unique(clave, return_counts=True)
+
+        if limite is not None and limite < len(conteos):
+            elegidos = np.argpartition(-conteos, limite - 1)[:limite]
+            claves, conteos = claves[elegidos], conteos[elegidos]
+        orden = np.argsort(-conteos, kind='stable')
+        claves, conteos = claves[orden], conteos[orden]
+
+        # Separa la clave combinada en los códigos de cada dimensión
+        columnas = {}
+        for dimension, base, minimo in reversed(list(zip(agrupar, bases, minimos))):
+            columnas[dimension] = self._valor(dimension, (claves % base + minimo).tolist())
+            claves = claves // base
+        nombres = list(agrupar) + ['reproducciones']
+        return [dict(zip(nombres, fila)) for fila in zip(*(columnas[d] for d in agrupar), conteos.tolist())]
+
+def _parsear_filtro(texto):
+    dimension, _, valores = texto.partition('=')
+    valores = valores.split(',')
+    return dimension, valores if len(valores) > 1 else valores[0]
+
+def main(argv=None):
+    import cargar_datos_cassandra as carga
+
+    parser = argparse.ArgumentParser(description="Consultas ad hoc de agrupación sobre las escuchas en memoria.")
+    parser.add_argument("--agrupar", default="",
+                        help=f"Dimensiones separadas por comas ({', '.join(DIMENSIONES)})")
+    parser.add_argument("--filtro", action="append", default=[], metavar="DIM=VALOR[,VALOR...]",
+                        help="Filtro por una dimensión (se puede repetir)")
+    parser.add_argument("--desde", help="Fecha mínima AAAA-MM-DD")
+    parser.add_argument("--hasta", help="Fecha máxima AAAA-MM-DD")
+    parser.add_argument("--limite", type=int, default=20, help="Filas a mostrar")
+    parser.add_argument("--desde-cassandra", action="store_true",
+                        help="Lee las escuchas de Cassandra en lugar de los CSV")
+    args = parser.parse_args(argv)
+
+    if args.desde_cassandra:
+        motor = MotorCubos.desde_cassandra(carga.conectar_cassandra())
+    else:
+        motor = MotorCubos.desde_csv(carga.ARCHIVO_ESCUCHAS, carga.ARCHIVO_USUARIOS, carga.ARCHIVO_CANCIONES,
+                                     carga.cargar_dimensiones)
+    inicio = time.time()
+    filas = motor.consultar([d for d in args.agrupar.split(',') if d],
+                            dict(_parsear_filtro(f) for f in args.filtro),
+                            desde=args.desde, hasta=args.hasta, limite=args.limite)
+    print(f"⏱️ Consulta resuelta en {(time.time() - inicio) * 1000:.1f} ms")
+    for fila in filas:
+        print(fila)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+VENTANA = 1000         # Últimas mediciones por consulta usadas en los percentiles
+PERCENTILES = (50, 95, 99)
+
+class Medicion:
+    """Datos de una llamada en curso: fases, páginas leídas y resultado del cache."""
+
+    def __init__(self, consulta):
+        self.consulta = consulta
+        self.fases = defaultdict(float)
+        self.paginas = 0
+        self.cache = None
+        self.error = False
+
+_medicion_actual = contextvars.ContextVar('medicion_olap', default=None)
+
+def _percentiles(valores):
+    if not valores:
+        return {f'p{p}': None for p in PERCENTILES}
+    ordenados = sorted(valores)
+    return {f'p{p}': ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+            for p in PERCENTILES}
+
+class Metricas:
+    """
+    Latencias (total y por fase), filas, páginas y resultado del cache de
+    cada función de consulta. Los percentiles se calculan sobre las últimas
+    ventana llamadas de cada una.
+    """
+
+    def __init__(self, ventana=VENTANA):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._totales = defaultdict(lambda: deque(maxlen=self.ventana))
+            self._fases = defaultdict(lambda: defaultdict(lambda: deque(maxlen=self.ventana)))
+            self._llamadas = Counter()
+            self._errores = Counter()
+            self._filas = Counter()
+            self._paginas = Counter()
+            self._cache = defaultdict(Counter)
+
+    def registrar(self, medicion, segundos, filas, error=False):
+        consulta = medicion.consulta
+        # El tiempo no atribuido a ninguna fase (armado de filas, cache, etc.)
+        fases = dict(medicion.fases, resto=max(0.0, segundos - sum(medicion.fases.values())))
+        with self._lock:
+            self._llamadas[consulta] += 1
+            self._errores[consulta] += error or medicion.error
+            self._filas[consulta] += filas
+            self._paginas[consulta] += medicion.paginas
+            self._cache[consulta][medicion.cache or 'sin cache'] += 1
+            self._totales[consulta].append(segundos)
+            for fase, duracion in fases.items():
+                self._fases[consulta][fase].append(duracion)
+
+    def resumen(self):
+        """Diccionario consulta -> llamadas, filas, páginas, cache y percentiles (segundos)."""
+        with self._lock:
+            return {
+                consulta: {
+                    'llamadas': self._llamadas[consulta],
+                    'errores': self._errores[consulta],
+                    'filas': self._filas[consulta],
+                    'paginas': self._paginas[consulta],
+                    'cache': dict(self._cache[consulta]),
+                    'latencia': _percentiles(self._totales[consulta]),
+                    'fases': {fase: _percentiles(valores) for fase, valores in self._fases[consulta].items()},
+                }
+                for consulta in self._llamadas
+            }
+
+    def volcar(self, ruta):
+        """Escribe resumen() en un archivo JSON."""
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.resumen(), f, indent=2, ensure_ascii=False)
+
+metricas = Metricas()
+
+# Anotaciones sobre la medición en curso (no hacen nada fuera de una)
+@contextmanager
+def fase(nombre):
+    """Suma la duración del bloque a la fase nombre de la medición en curso."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion = _medicion_actual.get()
+        if medicion is not None:
+            medicion.fases[nombre] += time.perf_counter() - inicio
+
+def anotar_pagina():
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.paginas += 1
+
+def anotar_cache(resultado):
+    """
+    Registra 'acierto', 'fallo', 'compartida' o 'derivado' (calculado de un
+    resultado que ya estaba en cache); solo el primero por llamada.
+    """
+    medicion = _medicion_actual.get()
+    if medicion is not None and medicion.cache is None:
+        medicion.cache = resultado
+
+def anotar_error():
+    """Marca la llamada como fallida aunque la consulta devuelva un resultado vacío en su lugar."""
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.error = True
+
+def _filas(resultado):
+    return len(resultado) if isinstance(resultado, (list, tuple)) else 0
+
+def instrumentada(funcion):
+    """Mide cada llamada de funcion (síncrona o async) y la registra en metricas."""
+    if asyncio.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltura_async(*args, **kwargs):
+            medicion = Medicion(funcion.__name__)
+            token = _medicion_actual.set(medicion)
+            inicio = time.perf_counter()
+            resultado, error = None, True
+            try:
+                resultado = await funcion(*args, **kwargs)
+                error = False
+                return resultado
+            finally:
+                _medicion_actual.reset(token)
+                metricas.registrar(medicion, time.perf_counter() - inicio, _filas(resultado), error)
+        return envoltura_async
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        medicion = Medicion(funcion.__name__)
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        resultado, error = None, True
+        try:
+            resultado = funcion(*args, **kwargs)
+            error = False
+            return resultado
+        finally:
+            _medicion_actual.reset(token)
+            metricas.registrar(medicion, time.perf_counter() - inicio, _filas(resultado), error)
+    return envoltura
@@ -71,6 +71,8 @@ filtro_genero = ctk.StringVar(value="Todos")
 filtro_artista = ctk.StringVar(value="Todos")
 filtro_ciudad = ctk.StringVar(value="Todos")
 filtro_mes = ctk.StringVar(value="Todos")
+# Canciones por usuario en el top ("Todas" = ranking completo)
+top_n_canciones = ctk.StringVar(value="Todas")
 
 def cargar_datos_async(consulta_func, callback, *args):
     """
@@ -209,57 +211,67 @@ def crear_filtros_reactivos(frame_filtros, tipo_consulta, datos_originales, colu
     """
     Crea filtros reactivos que se aplican automáticamente.
     """
+    def mes_seleccionado_raw():
+        """Mes AAAA-MM del filtro de mes, o None si es "Todos"."""
+        mes_seleccionado = filtro_mes.get()
+        if mes_seleccionado == "Todos":
+            return None
+        # Encontrar el mes raw correspondiente
+        for mes in sorted(set(fila['mes'] for fila in datos_originales)):
+            if convertir_mes_a_nombre(mes) == mes_seleccionado:
+                return mes
+        return None
+
+    def mostrar_filtrados(datos_filtrados):
+        mostrar_tabla_con_filtros_limpia(datos_filtrados, columnas, titulo, tipo_consulta)
+
     def aplicar_filtros_automatico():
-        """Aplica filtros automáticamente cuando cambian los valores."""
+        """
+        Aplica filtros automáticamente cuando cambian los valores. Si se elige
+        la clave de partición (género, artista o ciudad) se consulta solo esa
+        partición en Cassandra; el resto se filtra en memoria.
+        """
         datos_filtrados = datos_originales.copy()
         
         if tipo_consulta == "genero_mes":
             genero_seleccionado = filtro_genero.get()
-            mes_seleccionado = filtro_mes.get()
+            mes_raw = mes_seleccionado_raw()
             
             if genero_seleccionado != "Todos":
-                datos_filtrados = [fila for fila in datos_filtrados if fila['genero'] == genero_seleccionado]
+                cargar_datos_async(olap.consultar_reproducciones_por_genero_mes_filtrado, mostrar_filtrados,
+                                   genero_seleccionado, mes_raw, mes_raw)
+                return
             
-            if mes_seleccionado != "Todos":
-                # Encontrar el mes raw correspondiente
-                meses_raw = sorted(set(fila['mes'] for fila in datos_originales))
-                mes_raw = None
-                for mes in meses_raw:
-                    if convertir_mes_a_nombre(mes) == mes_seleccionado:
-                        mes_raw = mes
-                        break
-                if mes_raw:
-                    datos_filtrados = [fila for fila in datos_filtrados if fila['mes'] == mes_raw]
+            if mes_raw:
+                datos_filtrados = [fila for fila in datos_filtrados if fila['mes'] == mes_raw]
         
         elif tipo_consulta == "artista_mes":
             artista_seleccionado = filtro_artista.get()
-            mes_seleccionado = filtro_mes.get()
+            mes_raw = mes_seleccionado_raw()
             
             if artista_seleccionado != "Todos":
-                datos_filtrados = [fila for fila in datos_filtrados if fila['artista'] == artista_seleccionado]
+                cargar_datos_async(olap.consultar_reproducciones_por_artista_mes_filtrado, mostrar_filtrados,
+                                   artista_seleccionado, mes_raw, mes_raw)
+                return
             
-            if mes_seleccionado != "Todos":
-                meses_raw = sorted(set(fila['mes'] for fila in datos_originales))
-                mes_raw = None
-                for mes in meses_raw:
-                    if convertir_mes_a_nombre(mes) == mes_seleccionado:
-                        mes_raw = mes
-                        break
-                if mes_raw:
-                    datos_filtrados = [fila for fila in datos_filtrados if fila['mes'] == mes_raw]
+            if mes_raw:
+                datos_filtrados = [fila for fila in datos_filtrados if fila['mes'] == mes_raw]
         
         elif tipo_consulta == "ciudad_genero":
             ciudad_seleccionada = filtro_ciudad.get()
             genero_seleccionado = filtro_genero.get()
             
             if ciudad_seleccionada != "Todos":
-                datos_filtrados = [fila for fila in datos_filtrados if fila['ciudad'] == ciudad_seleccionada]
+                genero = genero_seleccionado if genero_seleccionado != "Todos" else None
+                cargar_datos_async(olap.consultar_reproducciones_por_ciudad_genero_filtrado, mostrar_filtrados,
+                                   ciudad_seleccionada, genero)
+                return
             
             if genero_seleccionado != "Todos":
                 datos_filtrados = [fila for fila in datos_filtrados if fila['genero'] == genero_seleccionado]
         
         # Actualizar tabla inmediatamente
-        mostrar_tabla_con_filtros_limpia(datos_filtrados, columnas, titulo, tipo_consulta)
+        mostrar_filtrados(datos_filtrados)
 
     def limpiar_todos_los_filtros():
         """Limpia todos los filtros y recarga todos los datos originales desde la base de datos."""
@@ -415,6 +427,7 @@ def mostrar_tabla_simple_limpia(datos, columnas, titulo):
         "Ciudad": "ciudad",
         "Usuario ID": "usuario",
         "Canción": "cancion",
+        "Posición": "posicion",
         "Día": "fecha"
     }
     
@@ -503,12 +516,24 @@ def reproducciones_por_ciudad_genero():
     )
 
 def top_canciones_por_usuario():
+    if top_n_canciones.get() == "Todas":
+        cargar_datos_async(
+            olap.consultar_top_canciones_por_usuario_optimizado,
+            lambda datos: mostrar_tabla_simple_limpia(
+                datos, ["Usuario ID", "Canción", "Reproducciones"],
+                "👤 Top Canciones por Usuario"
+            )
+        )
+        return
+    # Solo las n primeras de cada usuario, ya ordenadas por Cassandra
+    n = int(top_n_canciones.get())
     cargar_datos_async(
-        olap.consultar_top_canciones_por_usuario_optimizado,
+        olap.consultar_top_canciones,
         lambda datos: mostrar_tabla_simple_limpia(
-            datos, ["Usuario ID", "Canción", "Reproducciones"],
-            "👤 Top Canciones por Usuario"
-        )
+            datos, ["Usuario ID", "Posición", "Canción", "Reproducciones"],
+            f"👤 Top {n} Canciones por Usuario"
+        ),
+        n
     )
 
 def tendencia_por_dia():
@@ -527,7 +552,11 @@ def salir_app():
 ctk.CTkButton(frame_principal, text="🎧 Reproducciones Totales por Género (Mes)", command=reproducciones_por_genero_mes, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=10)
 ctk.CTkButton(frame_principal, text="🎤 Reproducciones Totales por Artista (Mes)", command=reproducciones_por_artista_mes, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=10)
 ctk.CTkButton(frame_principal, text="🌍 Reproducciones por Ciudad y Género", command=reproducciones_por_ciudad_genero, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=10)
-ctk.CTkButton(frame_principal, text="👤 Canciones más escuchadas por Usuario (Último mes)", command=top_canciones_por_usuario, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=10)
+ctk.CTkButton(frame_principal, text="👤 Canciones más escuchadas por Usuario (Último mes)", command=top_canciones_por_usuario, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=(10, 0))
+frame_top_n = ctk.CTkFrame(frame_principal, fg_color="transparent")
+frame_top_n.pack(pady=(2, 10))
+ctk.CTkLabel(frame_top_n, text="Canciones por usuario:").pack(side="left", padx=5)
+ctk.CTkOptionMenu(frame_top_n, variable=top_n_canciones, values=["Todas", str(olap.TOP_N_POR_DEFECTO), "10", "20"], width=100).pack(side="left", padx=5)
 ctk.CTkButton(frame_principal, text="📈 Total de Reproducciones por Día", command=tendencia_por_dia, width=430, fg_color=color_consulta, hover_color=hover_consulta, font=fuente_boton).pack(pady=10)
 ctk.CTkButton(frame_principal, text="❌ Salir", command=salir_app, width=430, fg_color="red", hover_color="darkred", font=fuente_boton).pack(pady=20)
 
@@ -536,4 +565,8 @@ frame_principal.pack(fill="both", expand=True)
 
 # Iniciar aplicación
 if __name__ == "__main__":
+    # Resultados del arranque anterior desde disco (se revalidan en segundo plano)
+    olap.activar_almacen()
+    # Los cubos de los filtros se cargan mientras se muestra el menú
+    olap.precargar_datos_background()
     root.mainloop()
\ No newline at end of file
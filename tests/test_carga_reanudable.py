@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos'))
+
+import cargar_datos_cassandra as carga
+from benchmark_carga import SesionGrabadora
+
+# CSV sin salto de línea al final: la última fila también debe cargarse
+USUARIOS = "usuario_id,nombre,ciudad\n1,Ana,Lima\n2,Luis,Quito"
+CANCIONES = "cancion_id,titulo,artista,genero\n10,Uno,A,Rock\n11,Dos,B,Pop"
+ESCUCHAS = "usuario_id,cancion_id,fecha_escucha\n1,10,2024-01-05\n2,11,2024-01-06\n2,10,2024-02-01"
+
+class Interrumpida(Exception):
+    pass
+
+@pytest.fixture
+def archivos(tmp_path, monkeypatch):
+    rutas = {}
+    for nombre, contenido in (('usuarios', USUARIOS), ('canciones', CANCIONES), ('escuchas', ESCUCHAS)):
+        ruta = tmp_path / f'{nombre}.csv'
+        ruta.write_bytes(contenido.encode('utf-8'))
+        rutas[nombre] = str(ruta)
+    monkeypatch.setattr(carga, 'ARCHIVO_USUARIOS', rutas['usuarios'])
+    monkeypatch.setattr(carga, 'ARCHIVO_CANCIONES', rutas['canciones'])
+    monkeypatch.setattr(carga, 'ARCHIVO_ESCUCHAS', rutas['escuchas'])
+    return rutas
+
+def test_ultima_fila_sin_salto_de_linea(archivos, tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+
+    def interrumpir(**opciones):
+        raise Interrumpida()
+    # Se corta tras las tablas base para inspeccionar el checkpoint
+    monkeypatch.setattr(carga, 'calcular_agregados', interrumpir)
+
+    sesion = SesionGrabadora()
+    try:
+        with pytest.raises(Interrumpida):
+            carga.cargar_reanudable(sesion, ruta=checkpoint)
+    finally:
+        sesion.cerrar()
+
+    assert sesion.filas['usuarios'] == 2
+    assert sesion.filas['canciones'] == 2
+    assert sesion.filas['escuchas'] == 3
+
+    with open(checkpoint, encoding='utf-8') as f:
+        estado = json.load(f)
+    for ruta in archivos.values():
+        progreso = estado['archivos'][ruta]
+        assert progreso['completo']
+        assert progreso['posicion'] == os.path.getsize(ruta)
+
+def test_agregados_coinciden_con_tablas_base(archivos):
+    agregados, liberar = carga.calcular_agregados()
+    try:
+        assert sum(conteo for _, conteo in agregados['genero_mes'].items()) == 3
+    finally:
+        liberar()
+
+def test_delta_deja_la_linea_incompleta(archivos):
+    escuchas, progreso = carga.leer_escuchas_desde(archivos['escuchas'])
+    assert list(escuchas) == [(1, '2024-01-05', 10), (2, '2024-01-06', 11)]
+    assert progreso['offset'] < os.path.getsize(archivos['escuchas'])